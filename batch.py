@@ -0,0 +1,461 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# batch.py -- panchanga of many places, computed in parallel processes
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The Swiss ephemeris keeps global state (sidereal mode, swe.KETU, ...), so
+it cannot be shared between threads. Here each worker is a separate process
+which sets up the ephemeris once and then computes many places.
+
+Rows of (datetime, lat, lon, tz) in a CSV or JSONL file can be processed
+from the command line; the output has the same rows with columns added:
+
+    python -m panchanga batch rows.csv -o out.csv
+    python -m panchanga batch rows.jsonl -o - --fields tithi,positions,lagna
+
+`datetime` is local time, YYYY-MM-DD[ HH:MM[:SS]], and `tz` either hours
+east of UTC or a time zone name (Asia/Kolkata). Day fields (tithi,
+nakshatra, ... at sunrise) are computed once per date and place; instant
+fields (positions, lagna) for every row.
+"""
+
+from __future__ import division
+import sys
+import csv
+import json
+import time
+import datetime
+from collections import OrderedDict, deque
+from multiprocessing import Pool, cpu_count
+import swisseph as swe
+import panchanga
+import instrument
+
+
+def _init_worker(ayanamsa, lunation_table, instrumented):
+    """Runs once in every worker process"""
+    panchanga.set_ayanamsa_mode(*ayanamsa)
+    if lunation_table is not None:
+        from lunations import LunationTable
+        panchanga.use_lunation_table(LunationTable.load(lunation_table))
+    if instrumented:
+        instrument.enable()
+    else:
+        instrument.disable()  # a forked worker inherits the parent's state
+
+
+def _daily(args):
+    """daily() and, if instrumented, a snapshot() of its ephemeris calls"""
+    jd, place = args
+    if not instrument.enabled():
+        return panchanga.daily(jd, place), None
+    instrument.reset()
+    return panchanga.daily(jd, place), instrument.snapshot()
+
+
+def pool(workers=None, lunation_table=None):
+    """Process pool whose workers use the current ayanamsa setting and,
+       optionally, the lunation table saved at path `lunation_table`. The
+       workers record their ephemeris calls if instrument is enabled here"""
+    ayanamsa = tuple(panchanga.get_ayanamsa_mode())
+    return Pool(workers or cpu_count(), initializer=_init_worker,
+                initargs=(ayanamsa, lunation_table, instrument.enabled()))
+
+
+def daily_for_places(jd, places, workers=None, lunation_table=None,
+                     chunksize=32):
+    """Generates panchanga.daily(jd, place) for each of `places`, in the same
+       order, computed by `workers` processes (default: one per CPU). Their
+       ephemeris calls are added to those recorded by instrument, if any"""
+    with pool(workers, lunation_table) as processes:
+        for day, recorded in processes.imap(_daily,
+                                            ((jd, place) for place in places),
+                                            chunksize):
+            if recorded is not None:
+                instrument.merge(recorded)
+            yield day
+
+
+def daily_for_locations(jd, latitudes, longitudes, zones, **kwargs):
+    """daily_for_places() given time zone names instead of offsets, which
+       are resolved for date `jd` in bulk (see tzoffsets.py)"""
+    from tzoffsets import places_on
+    return daily_for_places(jd, places_on(jd, latitudes, longitudes, zones),
+                            **kwargs)
+
+
+def _hms(dms): return '%02d:%02d:%02d' % tuple(dms)
+
+
+# Fields of a row computed from panchanga.daily() of its date and place
+day_fields = OrderedDict([
+    ('tithi', lambda day: day.tithi[0]),
+    ('tithi_end', lambda day: _hms(day.tithi[1])),
+    ('nakshatra', lambda day: day.nakshatra[0]),
+    ('nakshatra_end', lambda day: _hms(day.nakshatra[1])),
+    ('yoga', lambda day: day.yoga[0]),
+    ('karana', lambda day: day.karana[0]),
+    ('vaara', lambda day: day.vaara),
+    ('masa', lambda day: day.masa[0]),
+    ('adhika', lambda day: int(day.masa[1])),
+    ('ritu', lambda day: day.ritu),
+    ('samvatsara', lambda day: day.samvatsara),
+    ('sunrise', lambda day: _hms(day.sunrise[1])),
+    ('sunset', lambda day: _hms(day.sunset[1])),
+])
+
+# Fields computed at the instant of a row; positions is one column (sidereal
+# longitude) per graha, named in the order of panchanga.planet_list
+instant_fields = ['positions', 'lagna']
+graha_columns = ['sun', 'moon', 'mars', 'mercury', 'jupiter', 'venus',
+                 'saturn', 'rahu', 'ketu', 'uranus', 'neptune']
+
+default_fields = ['tithi', 'nakshatra', 'yoga', 'karana', 'vaara', 'masa',
+                  'sunrise', 'sunset']
+
+
+def columns(fields):
+    """Output columns of `fields`"""
+    result = []
+    for field in fields:
+        if field == 'positions':
+            result.extend(graha_columns)
+        else:
+            result.append(field)
+    return result
+
+
+def _parse(row):
+    """Local date (JD), hours, and Place of an input row"""
+    text = str(row['datetime']).strip()
+    date, _, clock = text.replace('T', ' ').partition(' ')
+    year, month, day = [int(x) for x in date.split('-')]
+    datetime.date(year, month, day)  # ValueError if there is no such date
+    hours = sum(float(x) / 60 ** i
+                for i, x in enumerate(clock.split(':')) if x)
+    jd = panchanga.gregorian_to_jd(panchanga.Date(year, month, day))
+    lat = float(row['lat'] if 'lat' in row else row['latitude'])
+    lon = float(row['lon'] if 'lon' in row else row['longitude'])
+    tz = row['tz']
+    try:
+        tz = float(tz)
+    except ValueError:
+        from tzoffsets import offset_table
+        tz = offset_table(tz).offset(jd + hours / 24)
+    return jd, hours, panchanga.Place(lat, lon, tz)
+
+
+_days = OrderedDict()  # (jd, place) -> Daily, most recently used last
+_days_size = 4096
+
+
+def _day(jd, place):
+    """panchanga.daily(), remembered across the chunks of a worker"""
+    key = (jd, place)
+    if key in _days:
+        _days.move_to_end(key)
+    else:
+        _days[key] = panchanga.daily(jd, place)
+        if len(_days) > _days_size:
+            _days.popitem(last=False)
+    return _days[key]
+
+
+def _chunk(args):
+    """Output rows (input row and added fields) of a chunk of input rows.
+       Rows are grouped by date and place; a row that cannot be computed
+       gets the message in an `error` column."""
+    rows, fields = args
+    groups = OrderedDict()
+    out = [None] * len(rows)
+    for i, row in enumerate(rows):
+        try:
+            jd, hours, place = _parse(row)
+        except (KeyError, ValueError, TypeError) as e:
+            out[i] = dict(row, error='%s: %s' % (type(e).__name__, e))
+            continue
+        groups.setdefault((jd, place), []).append((i, hours))
+
+    from vectorized import sidereal_longitudes
+    for (jd, place), members in groups.items():
+        values = {}
+        try:
+            if any(field in day_fields for field in fields):
+                day = _day(jd, place)
+                for field in fields:
+                    if field in day_fields:
+                        values[field] = day_fields[field](day)
+        except (swe.Error, ValueError) as e:
+            # e.g. no sunrise in a polar night
+            for i, hours in members:
+                out[i] = dict(rows[i], error='%s: %s' % (type(e).__name__, e))
+            continue
+        jds = [jd + (hours - place.timezone) / 24 for i, hours in members]
+        if 'positions' in fields:
+            longitudes = sidereal_longitudes(jds).tolist()
+        for k, (i, hours) in enumerate(members):
+            result = dict(rows[i])
+            result.update(values)
+            try:
+                if 'positions' in fields:
+                    result.update(zip(graha_columns, longitudes[k]))
+                if 'lagna' in fields:
+                    result['lagna'] = panchanga.sidereal_ascendant(
+                        jds[k], place.latitude, place.longitude)
+            except (swe.Error, ValueError) as e:
+                result = dict(rows[i], error='%s: %s' % (type(e).__name__, e))
+            out[i] = result
+    return out
+
+
+def read_rows(fp, format):
+    """Generates the rows (dicts) of a CSV or JSONL file"""
+    if format == 'csv':
+        for row in csv.DictReader(fp):
+            yield row
+    else:
+        for line in fp:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def process(rows, fields=default_fields, workers=None, chunksize=1000,
+            lunation_table=None):
+    """Generates the output rows of `rows` (an iterable of dicts), in order.
+       Chunks of `chunksize` rows are computed by `workers` processes
+       (default: one per CPU; 0 = in this process), with at most two chunks
+       per worker read ahead, so memory stays bounded for any input."""
+    fields = list(fields)
+    unknown = [f for f in fields if f not in day_fields and
+               f not in instant_fields]
+    if unknown:
+        raise ValueError("unknown fields: %s" % ', '.join(unknown))
+    chunks = ((chunk, fields) for chunk in _chunks(rows, chunksize))
+    if workers == 0:
+        for chunk in chunks:
+            for row in _chunk(chunk):
+                yield row
+        return
+    workers = workers or cpu_count()
+    with pool(workers, lunation_table) as processes:
+        pending = deque()
+        limit = 2 * workers
+        for chunk in chunks:
+            pending.append(processes.apply_async(_chunk, (chunk,)))
+            while len(pending) >= limit or (pending and pending[0].ready()):
+                for row in pending.popleft().get():
+                    yield row
+        while pending:
+            for row in pending.popleft().get():
+                yield row
+
+
+class Writer(object):
+    """Writes output rows to a CSV (header from the first row) or JSONL file"""
+
+    def __init__(self, fp, format, fields):
+        self.fp = fp
+        self.format = format
+        self.fields = fields
+        self._csv = None
+
+    def write(self, row):
+        if self.format != 'csv':
+            self.fp.write(json.dumps(row) + '\n')
+            return
+        if self._csv is None:
+            names = [name for name in row if name not in self.fields
+                     and name != 'error']
+            self._csv = csv.DictWriter(self.fp, names + self.fields +
+                                       ['error'], extrasaction='ignore',
+                                       lineterminator='\n')
+            self._csv.writeheader()
+        self._csv.writerow(row)
+
+
+def _format(path, format):
+    if format:
+        return format
+    return 'jsonl' if path.endswith(('.jsonl', '.json', '.ndjson')) else 'csv'
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(
+        prog='python -m panchanga batch',
+        description="Panchanga of every row of a CSV or JSONL file of "
+        "(datetime, lat, lon, tz)")
+    parser.add_argument('input', help="input file, or - for stdin")
+    parser.add_argument('-o', '--output', default='-',
+                        help="output file (default: stdout)")
+    parser.add_argument('--input-format', choices=['csv', 'jsonl'])
+    parser.add_argument('--output-format', choices=['csv', 'jsonl'])
+    parser.add_argument('--fields', default=','.join(default_fields),
+                        help="comma separated, of: %s" %
+                        ', '.join(list(day_fields) + instant_fields))
+    parser.add_argument('--workers', type=int, default=None,
+                        help="processes (default: one per CPU; 0 = none)")
+    parser.add_argument('--chunksize', type=int, default=1000)
+    parser.add_argument('--lunation-table',
+                        help="lunation table saved by lunations.py")
+    parser.add_argument('--quiet', action='store_true',
+                        help="no progress on stderr")
+    args = parser.parse_args(argv)
+    fields = [f.strip() for f in args.fields.split(',') if f.strip()]
+
+    input_format = _format(args.input, args.input_format)
+    output_format = _format(args.output, args.output_format or
+                            (input_format if args.output == '-' else None))
+    fin = sys.stdin if args.input == '-' else open(args.input, newline='')
+    fout = sys.stdout if args.output == '-' else \
+        open(args.output, 'w', newline='')
+    writer = Writer(fout, output_format, columns(fields))
+    start = last = time.time()
+    n = 0
+    try:
+        for row in process(read_rows(fin, input_format), fields,
+                           args.workers, args.chunksize, args.lunation_table):
+            writer.write(row)
+            n += 1
+            if not args.quiet and time.time() - last >= 2:
+                last = time.time()
+                sys.stderr.write("%d rows, %.0f rows/s\n" %
+                                 (n, n / (last - start)))
+    finally:
+        if fin is not sys.stdin:
+            fin.close()
+        if fout is not sys.stdout:
+            fout.close()
+    if not args.quiet:
+        elapsed = time.time() - start
+        sys.stderr.write("%d rows in %.1f s (%.0f rows/s)\n" %
+                         (n, elapsed, n / elapsed if elapsed else 0))
+    return 0
+
+# ----- TESTS ------
+
+
+def cities_tests(count=400):
+    import json
+    import time
+    from panchanga import Place, Date, gregorian_to_jd, daily
+    print(sys._getframe().f_code.co_name)
+    with open("cities.json") as fp:
+        cities = json.load(fp)
+    # Local mean time is good enough here
+    places = [Place(c['latitude'], c['longitude'], c['longitude'] / 15.)
+              for c in list(cities.values())[:count] if abs(c['latitude']) < 60]
+    jd = gregorian_to_jd(Date(2013, 1, 18))
+
+    days = list(daily_for_places(jd, places[:20], workers=2))
+    assert(days == [daily(jd, place) for place in places[:20]])
+    # Calls made in the workers are recorded here
+    with instrument.instrumented():
+        list(daily_for_places(jd, places[:20], workers=2))
+    parallel = instrument.snapshot()
+    with instrument.instrumented():
+        [daily(jd, place) for place in places[:20]]
+    assert(parallel['by_function'] == instrument.snapshot()['by_function'])
+    summer = gregorian_to_jd(Date(2013, 7, 1))
+    days = list(daily_for_locations(summer, [60.17, 12.972], [24.935, 77.594],
+                                    ['Europe/Helsinki', 'Asia/Kolkata'],
+                                    workers=2))
+    assert(days == [daily(summer, Place(60.17, 24.935, +3.0)),
+                    daily(summer, Place(12.972, 77.594, +5.5))])
+
+    for workers in sorted(set([1, 2, cpu_count()])):
+        start = time.time()
+        n = sum(1 for day in daily_for_places(jd, places, workers))
+        elapsed = time.time() - start
+        print("%d workers: %d cities in %.2f s (%.0f cities/s)" %
+              (workers, n, elapsed, n / elapsed))
+
+
+def stream_tests(count=3000):
+    import io
+    import random
+    from panchanga import Place, Date, gregorian_to_jd, daily
+    from vectorized import sidereal_longitudes
+    print(sys._getframe().f_code.co_name)
+    places = [(12.972, 77.594, '5.5'), (60.17, 24.935, 'Europe/Helsinki'),
+              (25.569, 91.883, 'Asia/Kolkata')]
+    rnd = random.Random(1)
+    rows = []
+    for i in range(count):
+        lat, lon, tz = places[rnd.randrange(len(places))]
+        rows.append({'datetime': '2013-%02d-%02d %02d:%02d' % (
+            rnd.randint(1, 12), rnd.randint(1, 28), rnd.randint(0, 23),
+            rnd.randint(0, 59)), 'lat': lat, 'lon': lon, 'tz': tz})
+    rows.insert(5, {'datetime': '2013-02-30', 'lat': 1, 'lon': 2, 'tz': 0})
+    rows.insert(7, {'datetime': '2013-01-18', 'lat': 1})
+    # Polar night in Tromsø: no sunrise, so no day fields
+    rows.insert(9, {'datetime': '2013-12-21 12:00', 'lat': 69.65,
+                    'lon': 18.96, 'tz': 'Europe/Oslo'})
+
+    fields = ['tithi', 'masa', 'sunrise', 'positions', 'lagna']
+    out = list(process(rows[:200], fields, workers=0, chunksize=50))
+    assert(len(out) == 200 and 'error' in out[5] and 'error' in out[7])
+    assert('error' in out[9] and 'tithi' not in out[9])
+    assert(all('error' not in row for row in out[10:]))
+    day = daily(gregorian_to_jd(Date(2013, 6, 21)), Place(60.17, 24.935, 3.0))
+    row = next(process([{'datetime': '2013-06-21T12:00', 'lat': 60.17,
+                         'lon': 24.935, 'tz': 'Europe/Helsinki'}], fields,
+                       workers=0))
+    assert(row['tithi'] == day.tithi[0] and row['masa'] == day.masa[0])
+    assert(row['sunrise'] == _hms(day.sunrise[1]))
+    jd = swe.julday(2013, 6, 21, 12 - 3.0)
+    assert(abs(row['moon'] - sidereal_longitudes([jd])[0][1]) < 1e-9)
+
+    # Same rows in the same order through workers, and through the files
+    assert(list(process(rows[:200], fields, workers=2, chunksize=30)) == out)
+    fin = io.StringIO('datetime,lat,lon,tz\n2013-01-18 06:00,12.972,77.594,'
+                      '5.5\n2013-01-18 18:00,12.972,77.594,Asia/Kolkata\n')
+    fout = io.StringIO()
+    writer = Writer(fout, 'csv', columns(default_fields))
+    for row in process(read_rows(fin, 'csv'), workers=0):
+        writer.write(row)
+    lines = fout.getvalue().splitlines()
+    assert(lines[0] == 'datetime,lat,lon,tz,' + ','.join(default_fields) +
+           ',error')
+    assert(lines[1].split(',')[4:] == lines[2].split(',')[4:])
+
+    for fields in [default_fields, ['positions']]:
+        for workers in sorted(set([1, cpu_count()])):
+            start = time.time()
+            n = sum(1 for row in process(rows, fields, workers))
+            elapsed = time.time() - start
+            print("%s, %d workers: %d rows in %.2f s (%.0f rows/s)" %
+                  (','.join(fields), workers, n, elapsed, n / elapsed))
+
+
+if __name__ == "__main__":
+    cities_tests()
+    stream_tests()
@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# benchmark.py -- timings and ephemeris calls of the public functions
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Runs each public function on the fixed places and dates of the tests in
+panchanga.py, and reports per call the wall time (best of several rounds)
+and the number of Swiss ephemeris calls by kind.
+
+    python benchmark.py                 # compare with benchmark.json
+    python benchmark.py --save          # store results as the new baseline
+    python benchmark.py tithi masa      # only these
+
+A case regresses if it makes more ephemeris calls than the baseline, or is
+slower by more than --tolerance. Call counts are exact and portable; times
+are only comparable on the machine the baseline was saved on. The calls
+made in the worker processes of batch.daily_for_places() are counted too.
+"""
+
+from __future__ import division
+import os
+import sys
+import json
+import time
+import batch
+import vimsottari
+from panchanga import *
+from instrument import instrumented, snapshot
+
+default_baseline = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                'benchmark.json')
+
+bangalore = Place(12.972, 77.594, +5.5)
+shillong = Place(25.569, 91.883, +5.5)
+helsinki = Place(60.17, 24.935, +2.0)
+date1 = gregorian_to_jd(Date(2009, 7, 15))
+date2 = gregorian_to_jd(Date(2013, 1, 18))
+date3 = gregorian_to_jd(Date(1985, 6, 9))
+date4 = gregorian_to_jd(Date(2009, 6, 21))
+birth = swe.utc_to_jd(1985, 6, 9, 4, 10, 0, flag=swe.GREG_CAL)[1]
+
+
+def count_calls(func):
+    """Ephemeris calls made by func(), by kind"""
+    with instrumented():
+        func()
+    return snapshot()['calls']
+
+
+def cities(count=50):
+    """`count` places from cities.json, with local mean time"""
+    import citydb
+    db = citydb.load()
+    step = len(db) // count
+    return [Place(city.latitude, city.longitude, city.longitude / 15.)
+            for city in (db.city(i) for i in range(0, len(db), step))
+            if abs(city.latitude) < 60][:count]
+
+
+def cases():
+    """Name and function of each benchmark; each function makes one call
+       for every (date, place) pair"""
+    days = [(date1, bangalore), (date2, helsinki), (date4, shillong)]
+    places = cities()
+
+    def each(func):
+        return lambda: [func(jd, place) for jd, place in days]
+
+    return [
+        ('tithi', each(tithi)),
+        ('nakshatra', each(nakshatra)),
+        ('yoga', each(yoga)),
+        ('masa', each(masa)),
+        ('new_moon', lambda: [new_moon(jd, tithi(jd, place)[0], -1)
+                              for jd, place in days]),
+        ('sunrise', each(sunrise)),
+        ('gauri_chogadiya', each(gauri_chogadiya)),
+        ('planetary_positions', each(planetary_positions)),
+        ('ascendant', each(ascendant)),
+        ('navamsa', each(navamsa)),
+        ('vimsottari_mahadasa',
+         lambda: vimsottari.vimsottari_mahadasa(birth)),
+        ('daily', each(daily)),
+        ('calendar (bangalore, 1 year)',
+         lambda: list(calendar(date2, date2 + 365, bangalore))),
+        ('daily (%d cities, serial)' % len(places),
+         lambda: [daily(date2, place) for place in places]),
+        ('daily_for_places (%d cities)' % len(places),
+         lambda: list(batch.daily_for_places(date2, places))),
+    ]
+
+
+def measure(func, rounds=5, min_time=0.2):
+    """Best time of func() over `rounds` rounds of at least `min_time` s"""
+    best = None
+    for i in range(rounds):
+        n = 0
+        start = time.time()
+        while True:
+            func()
+            n += 1
+            elapsed = time.time() - start
+            if elapsed >= min_time:
+                break
+        best = elapsed / n if best is None else min(best, elapsed / n)
+    return best
+
+
+def run(names=None, rounds=5, min_time=0.2):
+    """Results of the benchmarks named (default: all), in order, as
+       {name: {'seconds': ..., 'calls': {kind: count}}}"""
+    results = {}
+    for name, func in cases():
+        if names and name.split()[0] not in names:
+            continue
+        results[name] = {'calls': count_calls(func),
+                         'seconds': measure(func, rounds, min_time)}
+    return results
+
+
+def compare(results, baseline, tolerance=0.25):
+    """Report lines of `results` against `baseline`, and the number of
+       regressions"""
+    lines = []
+    regressions = 0
+    for name, result in results.items():
+        calls = sum(result['calls'].values())
+        line = "%-30s %10.3f ms %7d calls" % (name, result['seconds'] * 1e3,
+                                              calls)
+        if name in baseline:
+            old = baseline[name]
+            old_calls = sum(old['calls'].values())
+            ratio = result['seconds'] / old['seconds']
+            line += "   %+6.1f%% time %+6d calls" % ((ratio - 1) * 100,
+                                                      calls - old_calls)
+            if calls > old_calls or ratio > 1 + tolerance:
+                line += "   REGRESSION"
+                regressions += 1
+        lines.append(line)
+    return lines, regressions
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('names', nargs='*', help="benchmarks to run")
+    parser.add_argument('--baseline', default=default_baseline)
+    parser.add_argument('--save', action='store_true',
+                        help="store results as the baseline")
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help="allowed slowdown (default: 0.25 = 25%%)")
+    parser.add_argument('--rounds', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    disable_longitude_cache()
+    results = run(args.names, args.rounds)
+    baseline = {}
+    if os.path.exists(args.baseline) and not args.save:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)
+    lines, regressions = compare(results, baseline, args.tolerance)
+    for line in lines:
+        print(line)
+    if args.save:
+        with open(args.baseline, 'w') as fp:
+            json.dump(results, fp, indent=1, sort_keys=True)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
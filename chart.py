@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# chart.py -- positions of all grahas and lagna, and divisional charts
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A Chart fetches the longitude and speed of every graha, and the lagna, once.
+Rasi (D1), navamsa (D9) and the other divisional charts of the Shodasavarga
+are derived from these on demand.
+
+    chart = Chart(jd, place)
+    chart.positions()       # same as planetary_positions(jd, place)
+    chart.varga(9)          # same as navamsa(jd, place)
+    chart.varga_lagna(9)    # navamsa sign of the lagna
+    chart.retrograde        # one flag per graha of planet_list
+
+Signs are numbered 0 = Mesha (Aries), ..., 11 = Meena (Pisces).
+"""
+
+from __future__ import division
+import swisseph as swe
+from panchanga import planet_list, sidereal_motion, nakshatra_pada, to_dms, \
+    ketu, sidereal_ascendant
+
+# Divisional charts (vargas) of the Shodasavarga, by number of divisions
+shodasavarga = [1, 2, 3, 4, 7, 9, 10, 12, 16, 20, 24, 27, 30, 40, 45, 60]
+
+
+def _varga_rule(n, sign):
+    """Sign at which the first of the `n` equal parts of `sign` falls, and
+       the number of signs each next part moves on"""
+    odd = (sign % 2 == 0)  # Mesha, the first sign, is odd
+    quality = sign % 3     # 0 = movable, 1 = fixed, 2 = dual
+    return {
+        1: (sign, 1),
+        2: (4, -1) if odd else (3, 1),     # hora: Simha, Karka
+        3: (sign, 4),                      # drekkana: 1st, 5th, 9th
+        4: (sign, 3),                      # chaturthamsa: kendras
+        7: (sign, 1) if odd else (sign + 6, 1),
+        9: (9 * sign, 1),                  # navamsa
+        10: (sign, 1) if odd else (sign + 8, 1),
+        12: (sign, 1),
+        16: ([0, 4, 8][quality], 1),       # from Mesha, Simha, Dhanus
+        20: ([0, 8, 4][quality], 1),       # from Mesha, Dhanus, Simha
+        24: (4, 1) if odd else (3, 1),     # from Simha, Karka
+        27: (3 * sign, 1),                 # from Mesha, Karka, Tula, Makara
+        40: (0, 1) if odd else (6, 1),     # from Mesha, Tula
+        45: ([0, 4, 8][quality], 1),       # from Mesha, Simha, Dhanus
+        60: (sign, 1),
+    }[n]
+
+
+def _varga_table(n):
+    """table[sign][part] = sign of the part-th of `n` equal parts of sign"""
+    table = []
+    for sign in range(12):
+        first, step = _varga_rule(n, sign)
+        table.append([(first + step * part) % 12 for part in range(n)])
+    return table
+
+
+# Trimsamsa (D30) has unequal parts: (degrees at which each part ends, and
+# its sign) for odd and even signs
+trimsamsa_odd = [(5, 0), (10, 10), (18, 8), (25, 2), (30, 6)]
+trimsamsa_even = [(5, 1), (12, 5), (20, 11), (25, 9), (30, 7)]
+
+# sign (0..11) -> part (0..n-1) -> varga sign, for every equal-part varga
+varga_tables = dict((n, _varga_table(n)) for n in shodasavarga if n != 30)
+
+
+def varga_sign(longitude, n):
+    """Sign in the D-`n` chart of given sidereal longitude"""
+    sign = int(longitude // 30) % 12
+    degrees = longitude % 30
+    if n == 30:
+        parts = trimsamsa_odd if sign % 2 == 0 else trimsamsa_even
+        for end, varga in parts:
+            if degrees < end:
+                return varga
+        return parts[-1][1]
+    return varga_tables[n][sign][min(int(degrees * n / 30), n - 1)]
+
+
+class Chart(object):
+    """Grahas and lagna at `jd` (local time) and `place`, as used by
+       planetary_positions() and ascendant()"""
+
+    def __init__(self, jd, place):
+        self.jd = jd
+        self.place = place
+        jd_ut = jd - place.timezone / 24.
+
+        motions = {}
+        for planet in planet_list:
+            if planet == swe.KETU:
+                continue
+            motions[planet] = sidereal_motion(jd_ut, planet)
+        rahu, rahu_speed = motions[swe.MEAN_NODE]
+        motions[swe.KETU] = (ketu(rahu), rahu_speed)
+        # Longitudes and daily motions (degrees), in order of planet_list
+        self.longitudes = [motions[planet][0] for planet in planet_list]
+        self.speeds = [motions[planet][1] for planet in planet_list]
+        self.retrograde = [speed < 0 for speed in self.speeds]
+
+        lat, lon, tz = place
+        self.lagna = sidereal_ascendant(jd_ut, lat, lon)
+        self._vargas = {}
+
+    def positions(self):
+        """As returned by planetary_positions()"""
+        return [[planet, int(longitude / 30), to_dms(longitude % 30),
+                 nakshatra_pada(longitude)]
+                for planet, longitude in zip(planet_list, self.longitudes)]
+
+    def ascendant(self):
+        """As returned by ascendant()"""
+        return [int(self.lagna / 30), to_dms(self.lagna % 30),
+                nakshatra_pada(self.lagna)]
+
+    def varga(self, n):
+        """[planet, sign] of each graha in the D-`n` chart (computed once)"""
+        if n not in self._vargas:
+            self._vargas[n] = [[planet, varga_sign(longitude, n)]
+                               for planet, longitude in
+                               zip(planet_list, self.longitudes)]
+        return self._vargas[n]
+
+    def varga_lagna(self, n): return varga_sign(self.lagna, n)
+
+    def rasi(self): return self.varga(1)
+
+    def navamsa(self): return self.varga(9)
+
+# ----- TESTS ------
+
+
+def chart_tests():
+    import instrument
+    from panchanga import Place, planetary_positions, ascendant, navamsa, \
+        navamsa_from_long
+    print(sys._getframe().f_code.co_name)
+    bangalore = Place(12.972, 77.594, +5.5)
+    jd = swe.julday(2015, 9, 25, 13 + 29/60. + 13/3600.)
+
+    modules = instrument.default_modules + [sys.modules[__name__]]
+    with instrument.instrumented(modules):
+        chart = Chart(jd, bangalore)
+        for n in shodasavarga:
+            chart.varga(n), chart.varga_lagna(n)
+    chart_calls = sum(instrument.snapshot()['calls'].values())
+    with instrument.instrumented(modules):
+        positions = planetary_positions(jd, bangalore)
+        nv = navamsa(jd, bangalore)
+        lagna = ascendant(jd, bangalore)
+    separate_calls = sum(instrument.snapshot()['calls'].values())
+    print("D1 to D60 and lagna: %d ephemeris calls; positions, navamsa and "
+          "ascendant: %d" % (chart_calls, separate_calls))
+
+    assert(chart.positions() == positions)
+    assert(chart.navamsa() == nv)
+    assert(chart.ascendant() == lagna == [8, [20, 23, 31], [20, 3]])
+    assert(chart.varga_lagna(9) == navamsa_from_long(chart.lagna))
+    assert(chart.retrograde[planet_list.index(swe.MEAN_NODE)])
+    assert(chart.retrograde[planet_list.index(swe.KETU)])
+
+    # Borders of the parts, and signs against the rules as stated
+    assert(varga_sign(0, 2) == 4 and varga_sign(15, 2) == 3)    # Simha, Karka
+    assert(varga_sign(45, 2) == 4 and varga_sign(30, 2) == 3)
+    assert([varga_sign(x, 3) for x in (30, 40, 50)] == [1, 5, 9])
+    assert([varga_sign(x, 4) for x in (0, 7.5, 15, 22.5)] == [0, 3, 6, 9])
+    assert(varga_sign(30, 7) == 7 and varga_sign(30, 10) == 9)
+    assert(varga_sign(240, 16) == 8 and varga_sign(30, 20) == 8)
+    assert(varga_sign(359.99, 30) == 7 and varga_sign(0, 30) == 0)
+    assert(varga_sign(17.9, 30) == 8 and varga_sign(41, 30) == 5)
+    assert([varga_sign(x, 27) for x in (0, 30, 60, 90)] == [0, 3, 6, 9])
+    for n in shodasavarga:
+        for sign in range(12):
+            assert(varga_sign(sign * 30 + 29.999999, n) in range(12))
+    for x in range(0, 3600):
+        assert(varga_sign(x / 10., 9) == navamsa_from_long(x / 10.))
+        assert(varga_sign(x / 10., 1) == int(x / 300))
+
+
+if __name__ == "__main__":
+    import sys
+    chart_tests()
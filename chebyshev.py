@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# chebyshev.py -- sidereal Sun and Moon from fitted Chebyshev polynomials
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The sidereal longitudes of the Sun and Moon, on which nearly every anga
+depends, fitted once by Chebyshev polynomials over consecutive intervals of
+a span of time (for the ayanamsa then in effect). Evaluating them is a
+few dozen multiplications instead of an ephemeris call.
+
+    eph = ChebyshevEphemeris.build(jd_start, jd_end)
+    eph.verify()                       # max errors against Swiss ephemeris
+    eph.save('sun_moon.npy')
+    ...
+    eph = ChebyshevEphemeris.load('sun_moon.npy')   # memory-mapped
+    panchanga.use_longitude_engine(eph)   # tithi(), nakshatra(), ...
+
+Outside its span, for other planets, or under another ayanamsa, the
+ephemeris declines (returns None) and the Swiss ephemeris is used.
+"""
+
+from __future__ import division
+from math import pi
+import numpy as np
+import swisseph as swe
+import panchanga
+from panchanga import Ayanamsa, get_ayanamsa_mode
+from vectorized import sidereal_longitudes
+
+# Length (days) of each interval and degree of the polynomial fitted to it.
+# Both fit to about 1e-4" of the Swiss ephemeris.
+intervals = {swe.SUN: (16, 10), swe.MOON: (8, 14)}
+
+# Header of the saved file: start, end, the Ayanamsa, number of intervals
+# of the sun and of the moon
+_header = 8
+
+
+def fit(planet, start, count):
+    """Coefficients (count, degree + 1) of the polynomials of `planet` on
+       `count` intervals from `start`, interpolating at Chebyshev nodes"""
+    interval, degree = intervals[planet]
+    n = degree + 1
+    k = np.arange(n)
+    nodes = np.cos(pi * (k + 0.5) / n)  # in [-1, 1]
+    jds = start + interval * (np.arange(count)[:, np.newaxis] +
+                              (nodes[np.newaxis, :] + 1) / 2)
+    longitudes = sidereal_longitudes(jds.ravel(), [planet])[:, 0]
+    # Continuous within each interval (no jump from 360° to 0°)
+    longitudes = longitudes.reshape(count, n)
+    longitudes = np.degrees(np.unwrap(np.radians(longitudes), axis=1))
+    basis = np.cos(pi * np.outer(k + 0.5, k) / n)  # T[j](nodes[k])
+    coefficients = 2 / n * longitudes.dot(basis)
+    coefficients[:, 0] /= 2
+    return coefficients
+
+
+def _evaluate(c, x):
+    """Value and derivative (by x) at x of the Chebyshev series c"""
+    t_prev, t = 1.0, x
+    d_prev, d = 0.0, 1.0
+    value = c[0] + c[1] * x
+    slope = c[1]
+    for ck in c[2:]:
+        # T[n+1] = 2x T[n] - T[n-1], so T'[n+1] = 2 T[n] + 2x T'[n] - T'[n-1]
+        t_prev, t, d_prev, d = (t, 2 * x * t - t_prev,
+                                d, 2 * t + 2 * x * d - d_prev)
+        value += ck * t
+        slope += ck * d
+    return value, slope
+
+
+class ChebyshevEphemeris(object):
+    """Sidereal longitudes of the Sun and Moon from `start` to `end` (JD, UT)
+       as Chebyshev coefficients per interval (float64 arrays by planet)"""
+
+    def __init__(self, start, end, ayanamsa, coefficients):
+        self.start = start
+        self.end = end
+        self.ayanamsa = ayanamsa
+        self.coefficients = coefficients
+
+    @classmethod
+    def build(cls, start, end):
+        """Fits the span `start` to `end` (JD, UT) for the current ayanamsa"""
+        coefficients = {}
+        for planet, (interval, degree) in intervals.items():
+            count = int(np.ceil((end - start) / interval))
+            coefficients[planet] = fit(planet, start, count)
+        return cls(start, end, get_ayanamsa_mode(), coefficients)
+
+    def save(self, path):
+        """Saves as a single .npy file, which load() can memory-map"""
+        sun, moon = self.coefficients[swe.SUN], self.coefficients[swe.MOON]
+        header = [self.start, self.end] + list(self.ayanamsa) + \
+            [len(sun), len(moon)]
+        np.save(path, np.concatenate([np.array(header, dtype=np.float64),
+                                      sun.ravel(), moon.ravel()]))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        data = np.load(path, mmap_mode='r' if mmap else None)
+        start, end, mode, t0, ayan_t0, tropical, n_sun, n_moon = \
+            data[:_header].tolist()
+        ayanamsa = Ayanamsa(int(mode), t0, ayan_t0, bool(tropical))
+        coefficients = {}
+        i = _header
+        for planet, count in [(swe.SUN, int(n_sun)), (swe.MOON, int(n_moon))]:
+            size = count * (intervals[planet][1] + 1)
+            coefficients[planet] = data[i:i + size].reshape(count, -1)
+            i += size
+        return cls(start, end, ayanamsa, coefficients)
+
+    def _locate(self, jd, planet):
+        """Coefficients (list) of the interval containing `jd`, and `jd`
+           scaled to [-1, 1] in it. None if it does not apply"""
+        if planet not in self.coefficients or \
+                not self.start <= jd < self.end or \
+                get_ayanamsa_mode() != self.ayanamsa:
+            return None
+        interval = intervals[planet][0]
+        i, t = divmod(jd - self.start, interval)
+        coefficients = self.coefficients[planet]
+        if i >= len(coefficients):
+            return None
+        return coefficients[int(i)].tolist(), 2 * t / interval - 1
+
+    def longitude(self, jd, planet):
+        """Same as panchanga.sidereal_longitude(), or None"""
+        located = self._locate(jd, planet)
+        if located is None:
+            return None
+        c, x = located
+        b1 = b2 = 0.0  # Clenshaw's recurrence
+        for ck in c[:0:-1]:
+            b1, b2 = ck + 2 * x * b1 - b2, b1
+        return (c[0] + x * b1 - b2) % 360
+
+    def motion(self, jd, planet):
+        """Same as panchanga.sidereal_motion(), or None"""
+        located = self._locate(jd, planet)
+        if located is None:
+            return None
+        value, slope = _evaluate(*located)
+        return value % 360, slope * 2 / intervals[planet][0]
+
+    def longitudes(self, jds, planet):
+        """Longitudes of `planet` at each of `jds`, all within the span"""
+        interval = intervals[planet][0]
+        i, t = np.divmod(np.asarray(jds, dtype=np.float64) - self.start,
+                         interval)
+        c = self.coefficients[planet][i.astype(np.intp)]
+        x = 2 * t / interval - 1
+        b1 = b2 = np.zeros(len(x))
+        for k in range(c.shape[1] - 1, 0, -1):
+            b1, b2 = c[:, k] + 2 * x * b1 - b2, b1
+        return (c[:, 0] + x * b1 - b2) % 360
+
+    def verify(self, samples=10000, seed=1):
+        """Maximum errors against the Swiss ephemeris at `samples` random
+           instants: in arc-seconds, and in the time (seconds) at which the
+           sun, the moon and the tithi cross a boundary"""
+        jds = np.random.RandomState(seed).uniform(self.start, self.end,
+                                                  samples)
+        truth = sidereal_longitudes(jds, [swe.SUN, swe.MOON])
+        errors, speeds = {}, {}
+        for column, (name, planet) in enumerate([('sun', swe.SUN),
+                                                 ('moon', swe.MOON)]):
+            errors[name] = (self.longitudes(jds, planet) - truth[:, column] +
+                            180) % 360 - 180
+            speeds[name] = np.array([self.motion(jd, planet)[1]
+                                     for jd in jds.tolist()])
+        tithi = np.abs((errors['moon'] - errors['sun']) /
+                       (speeds['moon'] - speeds['sun']))
+        return {
+            'sun_arcsec': np.abs(errors['sun']).max() * 3600,
+            'moon_arcsec': np.abs(errors['moon']).max() * 3600,
+            'sun_seconds': np.abs(errors['sun'] / speeds['sun']).max() * 86400,
+            'moon_seconds': np.abs(errors['moon'] /
+                                   speeds['moon']).max() * 86400,
+            'tithi_seconds': tithi.max() * 86400,
+        }
+
+# ----- TESTS ------
+
+
+def chebyshev_tests():
+    import os
+    import time
+    import tempfile
+    import instrument
+    from panchanga import Date, Place, gregorian_to_jd, tithi, nakshatra, \
+        yoga, lunar_phase, use_longitude_engine, sidereal_motion
+    print(sys._getframe().f_code.co_name)
+    bangalore = Place(12.972, 77.594, +5.5)
+    start = gregorian_to_jd(Date(2012, 1, 1))
+    t = time.time()
+    eph = ChebyshevEphemeris.build(start, start + 3 * 365)
+    print("3 years fitted in %.2f s" % (time.time() - t))
+    path = os.path.join(tempfile.mkdtemp(), 'sun_moon.npy')
+    eph.save(path)
+    eph = ChebyshevEphemeris.load(path)
+    print("%d bytes" % os.path.getsize(path))
+
+    errors = eph.verify()
+    print(", ".join("%s %.2g" % item for item in sorted(errors.items())))
+    assert(errors['sun_arcsec'] < 0.01 and errors['moon_arcsec'] < 0.01)
+    assert(errors['tithi_seconds'] < 0.01)
+
+    jd = start + 400.3
+    lon, speed = eph.motion(jd, swe.MOON)
+    expected = sidereal_motion(jd, swe.MOON)
+    assert(abs(lon - expected[0]) < 1e-6 and abs(speed - expected[1]) < 1e-4)
+    assert(eph.longitude(jd, swe.MARS) is None)
+    assert(eph.longitude(start - 1, swe.SUN) is None)
+
+    days = [start + i + 0.5 for i in range(0, 3 * 365, 11)]
+    anga = lambda: [(tithi(jd, bangalore), nakshatra(jd, bangalore),
+                     yoga(jd, bangalore), lunar_phase(jd)) for jd in days]
+    with instrument.instrumented():
+        t = time.time()
+        expected = anga()
+        swiss = time.time() - t
+    swiss_calls = instrument.snapshot()['calls'].get('calc_ut', 0)
+    use_longitude_engine(eph)
+    try:
+        with instrument.instrumented():
+            t = time.time()
+            result = anga()
+            fitted = time.time() - t
+        fitted_calls = instrument.snapshot()['calls'].get('calc_ut', 0)
+        with panchanga.ayanamsa_session(swe.SIDM_RAMAN):
+            assert(eph.longitude(jd, swe.SUN) is None)
+    finally:
+        use_longitude_engine(None)
+    assert([r[:3] for r in result] == [e[:3] for e in expected])
+    assert(all(abs(r[3] - e[3]) < 1e-6 for r, e in zip(result, expected)))
+    print("tithi, nakshatra, yoga, lunar_phase of %d days: Swiss ephemeris "
+          "%.2f s (%d calc_ut), Chebyshev %.2f s (%d calc_ut)" %
+          (len(days), swiss, swiss_calls, fitted, fitted_calls))
+
+
+if __name__ == "__main__":
+    import sys
+    chebyshev_tests()
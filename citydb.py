@@ -0,0 +1,469 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# citydb.py -- compact, memory-mapped database of the cities in cities.csv
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+cities.csv (name:latitude:longitude:timezone, one city per line) is compiled
+once into cities.bin, a flat binary file which is memory-mapped on load:
+
+    header                  magic, number of cities, of time zones, etc.
+    latitude[n]             float64, cities sorted by name
+    longitude[n]            float64
+    name_offsets[n + 1]     uint32, into the names blob
+    tz_offsets[n_tz + 1]    uint32, into the time zone blob
+    by_cell[n]              uint32, city ids ordered by grid cell
+    cell_start[cells + 1]   uint32, into by_cell
+    tz_index[n]             uint16, each time zone name is stored once
+    names, time zones       UTF-8
+
+Exact and prefix lookups are binary searches over the sorted names. Fuzzy
+lookups go through a trigram index, built on first use. Nearest-city
+lookups search the grid cells (2° x 2°) in rings around the point, until no
+unsearched cell can hold a closer city.
+"""
+
+from __future__ import division
+import os
+import sys
+import mmap
+import struct as binary
+import difflib
+from math import radians, sin, cos, asin, sqrt, pi
+from array import array
+from collections import namedtuple as struct
+
+City = struct('City', ['name', 'latitude', 'longitude', 'timezone'])
+
+_here = os.path.dirname(os.path.abspath(__file__))
+default_source = os.path.join(_here, 'cities.csv')
+default_path = os.path.join(_here, 'cities.bin')
+
+_magic = b'DPCITY2' + (b'<' if sys.byteorder == 'little' else b'>')
+_header = binary.Struct('8sIIII')  # magic, n, n_tz, names_size, tz_size
+
+_cell_size = 2  # degrees
+_rows, _cols = 180 // _cell_size, 360 // _cell_size
+earth_radius = 6371.0088  # km, mean
+
+
+def _cell(latitude, longitude):
+    row = min(int((latitude + 90) // _cell_size), _rows - 1)
+    return row * _cols + int((longitude + 180) // _cell_size) % _cols
+
+
+def _rings(cell):
+    """Generates the cells at ring r = 0, 1, ... around `cell`, each ring with
+       a lower bound (km) on the distance from any point in `cell` to any point
+       in a cell not generated yet"""
+    row, col = divmod(cell, _cols)
+    seen = set()
+    for r in range(max(_rows, _cols)):
+        low, high = max(row - r, 0), min(row + r, _rows - 1)
+        cells = []
+        for i in range(low, high + 1):
+            step = 1 if i in (row - r, row + r) else 2 * r
+            for j in range(col - r, col + r + 1, step):
+                c = i * _cols + j % _cols
+                if c not in seen:
+                    seen.add(c)
+                    cells.append(c)
+        # Cells outside the rows searched are r cells away in latitude;
+        # others at least r cells of longitude, which narrow towards a pole
+        if low == 0 and high == _rows - 1:
+            lat_bound = pi
+        else:
+            lat_bound = radians(r * _cell_size)
+        if 2 * r + 1 >= _cols:
+            lon_bound = pi
+        else:
+            polar = max(abs(low * _cell_size - 90),
+                        abs((high + 1) * _cell_size - 90))
+            lon_bound = asin(cos(radians(polar)) *
+                             sin(radians(min(r * _cell_size, 90))))
+        yield cells, earth_radius * min(lat_bound, lon_bound)
+
+
+def distance(lat1, lon1, lat2, lon2):
+    """Great-circle distance in km between two points (in degrees)"""
+    lat1, lon1, lat2, lon2 = map(radians, (lat1, lon1, lat2, lon2))
+    h = sin((lat2 - lat1) / 2) ** 2 + \
+        cos(lat1) * cos(lat2) * sin((lon2 - lon1) / 2) ** 2
+    return 2 * earth_radius * asin(min(1, sqrt(h)))
+
+
+def build(source=default_source, path=default_path):
+    """Compiles `source` (cities.csv) into `path` (cities.bin). Like
+       cities.json, a later line with the same name replaces an earlier one"""
+    cities = {}
+    with open(source) as fp:
+        for line in fp:
+            name, lat, lon, tz = line.rstrip('\n').split(':')
+            cities[name] = (float(lat), float(lon), tz)
+
+    names = sorted(cities, key=lambda name: name.encode('utf-8'))
+    zones = sorted(set(tz for lat, lon, tz in cities.values()))
+    zone_index = dict((tz, i) for i, tz in enumerate(zones))
+
+    def blob(strings):
+        offsets, data = array('I', [0]), bytearray()
+        for s in strings:
+            data += s.encode('utf-8')
+            offsets.append(len(data))
+        return offsets, bytes(data)
+
+    name_offsets, name_blob = blob(names)
+    tz_offsets, tz_blob = blob(zones)
+    cells = [_cell(*cities[name][:2]) for name in names]
+    by_cell = array('I', sorted(range(len(names)), key=cells.__getitem__))
+    cell_start = array('I', [0] * (_rows * _cols + 1))
+    for cell in cells:
+        cell_start[cell + 1] += 1
+    for i in range(_rows * _cols):
+        cell_start[i + 1] += cell_start[i]
+    with open(path, 'wb') as fp:
+        fp.write(_header.pack(_magic, len(names), len(zones),
+                              len(name_blob), len(tz_blob)))
+        array('d', [cities[name][0] for name in names]).tofile(fp)
+        array('d', [cities[name][1] for name in names]).tofile(fp)
+        name_offsets.tofile(fp)
+        tz_offsets.tofile(fp)
+        by_cell.tofile(fp)
+        cell_start.tofile(fp)
+        array('H', [zone_index[cities[name][2]] for name in names]).tofile(fp)
+        fp.write(name_blob)
+        fp.write(tz_blob)
+
+
+def trigrams(name):
+    name = '  ' + name.lower() + ' '
+    return set(name[i:i + 3] for i in range(len(name) - 2))
+
+
+class CityDB(object):
+    """Read-only view of a cities.bin file"""
+
+    def __init__(self, path=default_path):
+        with open(path, 'rb') as fp:
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._map)
+        magic, n, n_tz, names_size, tz_size = _header.unpack_from(view)
+        if magic != _magic:
+            raise ValueError("%s is not a cities database" % path)
+
+        def take(size, fmt=None):
+            section = view[self._offset:self._offset + size]
+            self._offset += size
+            return section.cast(fmt) if fmt else section
+
+        self._offset = _header.size
+        self.latitudes = take(8 * n, 'd')
+        self.longitudes = take(8 * n, 'd')
+        self._name_offsets = take(4 * (n + 1), 'I')
+        self._tz_offsets = take(4 * (n_tz + 1), 'I')
+        self._by_cell = take(4 * n, 'I')
+        self._cell_start = take(4 * (_rows * _cols + 1), 'I')
+        self._tz_index = take(2 * n, 'H')
+        self._names = take(names_size)
+        tz_blob = take(tz_size)
+        self.timezones = [bytes(tz_blob[self._tz_offsets[i]:
+                                        self._tz_offsets[i + 1]]).decode('utf-8')
+                          for i in range(n_tz)]
+        self._trigrams = None
+
+    def __len__(self): return len(self.latitudes)
+
+    def _name(self, i):
+        return bytes(self._names[self._name_offsets[i]:
+                                 self._name_offsets[i + 1]])
+
+    def name(self, i): return self._name(i).decode('utf-8')
+
+    def city(self, i):
+        return City(self.name(i), self.latitudes[i], self.longitudes[i],
+                    self.timezones[self._tz_index[i]])
+
+    def _lower_bound(self, key):
+        lo, hi = 0, len(self)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._name(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def get(self, name, default=None):
+        """City of exactly the given name"""
+        key = name.encode('utf-8')
+        i = self._lower_bound(key)
+        if i < len(self) and self._name(i) == key:
+            return self.city(i)
+        return default
+
+    def __contains__(self, name): return self.get(name) is not None
+
+    def prefix(self, prefix, limit=None):
+        """Generates cities whose names begin with `prefix`, in sorted order"""
+        key = prefix.encode('utf-8')
+        i = self._lower_bound(key)
+        while i < len(self) and self._name(i).startswith(key) and \
+                (limit is None or limit > 0):
+            yield self.city(i)
+            i += 1
+            limit = None if limit is None else limit - 1
+
+    def _build_trigrams(self):
+        """Trigram -> ids of the cities having it, all ids in one array and
+           each trigram mapped to (start << 32 | count) in that array"""
+        lists = {}
+        for i in range(len(self)):
+            for gram in trigrams(self.name(i)):
+                lists.setdefault(gram, []).append(i)
+        self._postings = array('I')
+        self._trigrams = {}
+        for gram, ids in lists.items():
+            self._trigrams[gram] = len(self._postings) << 32 | len(ids)
+            self._postings.extend(ids)
+
+    def fuzzy(self, name, n=5, cutoff=0.6, candidates=50):
+        """Names closest to `name`, best first, like difflib.get_close_matches.
+           Only the `candidates` names sharing most trigrams are compared"""
+        if self._trigrams is None:
+            self._build_trigrams()
+
+        postings = self._postings
+        shared = {}
+        for gram in trigrams(name):
+            span = self._trigrams.get(gram, 0)
+            for i in postings[span >> 32:(span >> 32) + (span & 0xffffffff)]:
+                shared[i] = shared.get(i, 0) + 1
+        best = sorted(shared, key=shared.get, reverse=True)[:candidates]
+
+        matcher = difflib.SequenceMatcher()
+        matcher.set_seq2(name)
+        scored = []
+        for i in best:
+            matcher.set_seq1(self.name(i))
+            if matcher.real_quick_ratio() >= cutoff and \
+                    matcher.quick_ratio() >= cutoff and \
+                    matcher.ratio() >= cutoff:
+                scored.append((matcher.ratio(), self.name(i)))
+        scored.sort(reverse=True)
+        return [city for score, city in scored[:n]]
+
+    def _in_cells(self, cells):
+        for c in cells:
+            for i in self._by_cell[self._cell_start[c]:self._cell_start[c + 1]]:
+                yield i
+
+    def nearest(self, latitude, longitude, k=1):
+        """The `k` cities closest to the point, nearest first, as a list of
+           (City, distance in km)"""
+        k = min(k, len(self))
+        found = []
+        for cells, bound in _rings(_cell(latitude, longitude)):
+            found.extend((distance(latitude, longitude, self.latitudes[i],
+                                   self.longitudes[i]), i)
+                         for i in self._in_cells(cells))
+            found.sort()
+            del found[k:]
+            if len(found) == k and found[-1][0] <= bound:
+                break
+        return [(self.city(i), km) for km, i in found]
+
+    def timezone_at(self, latitude, longitude):
+        """Time zone of the city nearest to the point"""
+        return self.nearest(latitude, longitude)[0][0].timezone
+
+    def nearest_many(self, latitudes, longitudes, k=1, chunk=16384):
+        """Ids (int64) and distances (km) of the `k` cities closest to each
+           point, nearest first; two arrays of shape (len(latitudes), k).
+           Needs NumPy. See city(), timezone_index()"""
+        import numpy as np
+        latitudes = np.asarray(latitudes, dtype=np.float64).ravel()
+        longitudes = np.asarray(longitudes, dtype=np.float64).ravel()
+        k = min(k, len(self))
+        ids = np.empty((len(latitudes), k), dtype=np.int64)
+        km = np.empty((len(latitudes), k), dtype=np.float64)
+        city_lat = np.radians(np.frombuffer(self.latitudes, np.float64))
+        city_lon = np.radians(np.frombuffer(self.longitudes, np.float64))
+        by_cell = np.frombuffer(self._by_cell, np.uint32)
+        cell_start = np.frombuffer(self._cell_start, np.uint32)
+
+        rows = np.minimum((latitudes + 90) // _cell_size, _rows - 1)
+        cols = ((longitudes + 180) // _cell_size) % _cols
+        cells = (rows * _cols + cols).astype(np.int64)
+
+        # Points grouped by cell, each group (up to `chunk` points) searched
+        # together
+        order = np.argsort(cells, kind='stable')
+        group_cells, starts = np.unique(cells[order], return_index=True)
+        ends = np.append(starts[1:], len(order))
+        for cell, group_start, group_end in zip(group_cells.tolist(),
+                                                starts.tolist(), ends.tolist()):
+            for start in range(group_start, group_end, chunk):
+                points = order[start:min(start + chunk, group_end)]
+                lat = np.radians(latitudes[points])[:, np.newaxis]
+                lon = np.radians(longitudes[points])[:, np.newaxis]
+                candidates = []
+                for ring, bound in _rings(cell):
+                    candidates.extend(by_cell[cell_start[c]:cell_start[c + 1]]
+                                      for c in ring)
+                    if bound == 0:
+                        continue
+                    near = np.concatenate(candidates).astype(np.int64)
+                    if len(near) < k:
+                        continue
+                    h = np.sin((city_lat[near] - lat) / 2) ** 2 + \
+                        np.cos(lat) * np.cos(city_lat[near]) * \
+                        np.sin((city_lon[near] - lon) / 2) ** 2
+                    d = 2 * earth_radius * np.arcsin(np.sqrt(np.minimum(h, 1)))
+                    best = np.argpartition(d, k - 1, axis=1)[:, :k]
+                    best_km = np.take_along_axis(d, best, axis=1)
+                    if best_km.max() <= bound:
+                        break
+                by_distance = np.argsort(best_km, axis=1)
+                ids[points] = near[np.take_along_axis(best, by_distance, 1)]
+                km[points] = np.take_along_axis(best_km, by_distance, 1)
+        return ids, km
+
+    def timezone_index(self, ids):
+        """Index into `timezones` of each of the city ids (NumPy array)"""
+        import numpy as np
+        return np.frombuffer(self._tz_index, np.uint16)[ids]
+
+
+_db = None
+
+
+def load(path=default_path, source=default_source):
+    """The cities database, opened once per process. It is (re)built from
+       `source` when `path` is missing or older than it"""
+    global _db
+    if _db is None:
+        if not os.path.exists(path) or \
+                os.path.getmtime(path) < os.path.getmtime(source):
+            build(source, path)
+        try:
+            _db = CityDB(path)
+        except ValueError:  # written by an older version
+            build(source, path)
+            _db = CityDB(path)
+    return _db
+
+# ----- TESTS ------
+
+
+def citydb_tests():
+    import json
+    import time
+    import tempfile
+    import tracemalloc
+    print(sys._getframe().f_code.co_name)
+    path = os.path.join(tempfile.mkdtemp(), 'cities.bin')
+
+    tracemalloc.start()
+    with open(os.path.join(_here, 'cities.json')) as fp:
+        cities = json.load(fp)
+    json_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    build(default_source, path)
+    tracemalloc.start()
+    db = CityDB(path)
+    db_bytes = tracemalloc.get_traced_memory()[0]
+    db.fuzzy('Bangalor')
+    fuzzy_bytes = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    print("python heap: dict %d KB, CityDB %d KB (%d KB with trigrams)" %
+          (json_bytes // 1024, db_bytes // 1024, fuzzy_bytes // 1024))
+
+    assert(len(db) == len(cities))
+    for name, city in cities.items():
+        assert(db.get(name) == City(name, city['latitude'], city['longitude'],
+                                    city['timezone']))
+    assert(db.get('Xanadu') is None)
+    assert(all(c.name.startswith('Ban') for c in db.prefix('Ban')))
+    assert(len(list(db.prefix('Ban', limit=3))) == 3)
+    assert(db.fuzzy('Bangalor')[0] == 'Bangalore')
+    assert(db.fuzzy('Helsinky')[0] == 'Helsinki')
+
+    for label, func, arg in [('exact', db.get, 'Bangalore'),
+                             ('prefix', lambda p: list(db.prefix(p, 10)), 'Ban'),
+                             ('fuzzy', db.fuzzy, 'Bangalor')]:
+        start = time.time()
+        for i in range(1000):
+            func(arg)
+        print("%s: %.1f us" % (label, (time.time() - start) * 1000))
+    start = time.time()
+    difflib.get_close_matches('Bangalor', cities.keys(), 5)
+    print("difflib over all names: %.1f us" % ((time.time() - start) * 1e6))
+
+
+def nearest_tests(count=1000000):
+    import time
+    import random
+    import tempfile
+    import numpy as np
+    print(sys._getframe().f_code.co_name)
+    path = os.path.join(tempfile.mkdtemp(), 'cities.bin')
+    build(default_source, path)
+    db = CityDB(path)
+
+    def brute_force(lat, lon, k):
+        return sorted((distance(lat, lon, db.latitudes[i], db.longitudes[i]), i)
+                      for i in range(len(db)))[:k]
+
+    assert(db.nearest(12.972, 77.594)[0][0].name == 'Bangalore')
+    assert(db.timezone_at(60.17, 24.94) == 'Europe/Helsinki')
+    random.seed(1)
+    points = [(random.uniform(-90, 90), random.uniform(-180, 180))
+              for i in range(200)]
+    points += [(89.9, 0), (-89.9, 179.9), (0, 179.99), (0, -180)]
+    ids, km = db.nearest_many([p[0] for p in points], [p[1] for p in points], 3)
+    for (lat, lon), row, row_km in zip(points, ids, km):
+        expected = brute_force(lat, lon, 3)
+        assert([city.name for city, d in db.nearest(lat, lon, 3)] ==
+               [db.name(i) for d, i in expected])
+        assert(list(row) == [i for d, i in expected])
+        assert(np.allclose(row_km, [d for d, i in expected]))
+
+    # Points near cities, as real inputs mostly are
+    lats = np.frombuffer(db.latitudes, np.float64)
+    lons = np.frombuffer(db.longitudes, np.float64)
+    random = np.random.RandomState(1)
+    pick = random.randint(0, len(db), count)
+    lats = np.clip(lats[pick] + random.normal(0, 0.5, count), -90, 90)
+    lons = lons[pick] + random.normal(0, 0.5, count)
+    start = time.time()
+    for lat, lon in zip(lats[:1000], lons[:1000]):
+        db.nearest(lat, lon)
+    print("nearest: %.0f us per point" % ((time.time() - start) * 1000))
+    start = time.time()
+    ids, km = db.nearest_many(lats, lons)
+    zones = db.timezone_index(ids[:, 0])
+    elapsed = time.time() - start
+    print("nearest_many: %d points in %.2f s (%.0f points/s)" %
+          (count, elapsed, count / elapsed))
+
+
+if __name__ == "__main__":
+    citydb_tests()
+    nearest_tests()
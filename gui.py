@@ -31,7 +31,8 @@ from time import strptime
 from pytz import timezone, utc
 from datetime import datetime
 from panchanga import *
-import difflib
+import citydb
+from tzoffsets import offset_table
 
 # begin wxGlade: extracode
 # end wxGlade
@@ -194,20 +195,21 @@ class Panchanga(wx.Frame):
         self.set_place(event)
         place = self.place
 
-        ti = tithi(jd, place)
-        nak = nakshatra(jd, place)
-        yog = yoga(jd, place)
-        mas = masa(jd, place)
-        rtu = ritu(mas[0])
-
-        kar = karana(jd, place)
-        vara = vaara(jd)
-        srise = sunrise(jd, place)[1]
-        sset = sunset(jd, place)[1]
-        kday = ahargana(jd)
-        kyear, sakayr = elapsed_year(jd, mas[0])
-        samvat = samvatsara(jd, mas[0])
-        day_dur = day_duration(jd, place)[1]
+        day = daily(jd, place)
+        ti = day.tithi
+        nak = day.nakshatra
+        yog = day.yoga
+        mas = day.masa
+        rtu = day.ritu
+
+        kar = day.karana
+        vara = day.vaara
+        srise = day.sunrise[1]
+        sset = day.sunset[1]
+        kday = day.ahargana
+        kyear, sakayr = day.kali, day.saka
+        samvat = day.samvatsara
+        day_dur = day.day_duration[1]
         gauri = self.gauri_panchanga(jd)
         positions = self.kundali(jd)
 
@@ -247,15 +249,15 @@ class Panchanga(wx.Frame):
 
     def search_location(self, event):  # wxGlade: Panchanga.<event_handler>
         city = self.placeTxt.Value.title()  # Convert to title-case
-        if self.cities.has_key(city):
+        found = self.cities.get(city)
+        if found:
             self.searchBtn.SetForegroundColour(wx.Colour(0x2C, 0x2C, 0x2C))
             # self.searchBtn.SetLabel("Found!")
 
             date = self.parse_date()
-            city = self.cities[city]
-            lat = city['latitude']
-            lon = city['longitude']
-            tzname = city['timezone']
+            lat = found.latitude
+            lon = found.longitude
+            tzname = found.timezone
             self.tzone = timezone(tzname)
             tz_offset = self.compute_timezone_offset()
             self.place = Place(lat, lon, tz_offset)
@@ -266,7 +268,7 @@ class Panchanga(wx.Frame):
             self.tzTxt.SetValue("%+.2f" % tz_offset)
         else:
             # Find nearest match
-            nearest = difflib.get_close_matches(city, self.all_cities, 5)
+            nearest = self.cities.fuzzy(city, 5)
             all_matches = ""
             for m in nearest:
                 all_matches += m + '\n'
@@ -287,10 +289,7 @@ class Panchanga(wx.Frame):
         return date
 
     def init_db(self):
-        fp = open("cities.json")
-        self.cities = json.load(fp)
-        self.all_cities = self.cities.keys()
-        fp.close()
+        self.cities = citydb.load()
         sktnames = load_json_file("sanskrit_names.json")
         self.tithis = sktnames["tithis"]
         self.nakshatras = sktnames["nakshatras"]
@@ -314,10 +313,8 @@ class Panchanga(wx.Frame):
 
     def compute_timezone_offset(self):
         date = self.parse_date()
-        timezone = self.tzone
-        dt = datetime(date.year, date.month, date.day)
         # offset from UTC (in hours). Needed especially for DST countries
-        tz_offset = timezone.utcoffset(dt, is_dst = True).total_seconds() / 3600.
+        tz_offset = offset_table(self.tzone).offset(gregorian_to_jd(date))
         return tz_offset
 
     def gauri_panchanga(self, jd):
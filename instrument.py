@@ -0,0 +1,265 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# instrument.py -- counts and times the Swiss ephemeris calls of the library
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Opt-in instrumentation of the ephemeris calls made by panchanga.py and
+vimsottari.py. While enabled, their `swe` is replaced by a stand-in that
+counts and times each call of ephemeris_calls, and charges it to the public
+function it was made for: the outermost function of those modules on the
+stack (so the calc_ut calls of masa() inside daily() count for daily()).
+When disabled, the modules use swisseph directly, at no cost.
+
+    instrument.enable()
+    ...
+    stats = instrument.snapshot()
+    instrument.export(sys.stdout)     # Prometheus text format
+    instrument.merge(other)           # snapshot() of another process
+    instrument.reset()
+    instrument.disable()
+"""
+
+from __future__ import division
+import sys
+import json
+from time import perf_counter
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+import panchanga
+import vimsottari
+
+# Functions of the Swiss ephemeris that do the actual computing
+ephemeris_calls = ['calc_ut', 'rise_trans', 'houses_ex', 'fixstar_ut',
+                   'get_ayanamsa_ut', 'set_sid_mode']
+
+default_modules = [panchanga, vimsottari]
+
+
+class Stats(object):
+    """Calls, time (s) and latency histogram per kind of ephemeris call, and
+       calls per public function"""
+
+    def __init__(self):
+        self.calls = Counter()
+        self.seconds = Counter()
+        # bucket b holds calls of [2**(b-1), 2**b) microseconds
+        self.histogram = defaultdict(Counter)
+        self.by_function = defaultdict(Counter)
+
+    def add(self, kind, function, elapsed):
+        self.calls[kind] += 1
+        self.seconds[kind] += elapsed
+        self.histogram[kind][int(elapsed * 1e6).bit_length()] += 1
+        self.by_function[function][kind] += 1
+
+    def merge(self, recorded):
+        """Adds a snapshot() recorded elsewhere, e.g. in a worker process"""
+        self.calls.update(recorded['calls'])
+        self.seconds.update(recorded['seconds'])
+        for kind, buckets in recorded['histogram'].items():
+            for upper, n in buckets.items():
+                self.histogram[kind][int(upper).bit_length() - 1] += n
+        for function, calls in recorded['by_function'].items():
+            self.by_function[function].update(calls)
+
+    def snapshot(self):
+        return {
+            'calls': dict(self.calls),
+            'seconds': dict(self.seconds),
+            'histogram': dict((kind, dict((2 ** b, n) for b, n in
+                                          sorted(buckets.items())))
+                              for kind, buckets in self.histogram.items()),
+            'by_function': dict((function, dict(calls)) for function, calls
+                                in self.by_function.items()),
+        }
+
+
+class InstrumentedSwe(object):
+    """Stands in for the swisseph module, recording calls into `stats`"""
+
+    def __init__(self, module, stats, files):
+        self._module = module
+        for kind in ephemeris_calls:
+            setattr(self, kind, self._wrap(kind, getattr(module, kind),
+                                           stats, files))
+
+    @staticmethod
+    def _wrap(kind, func, stats, files):
+        def wrapped(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.add(kind, _caller(files), perf_counter() - start)
+        return wrapped
+
+    def __getattr__(self, name): return getattr(self._module, name)
+
+
+def _caller(files):
+    """Outermost public function on the stack defined in one of `files`"""
+    function = None
+    frame = sys._getframe(2)
+    while frame is not None:
+        code = frame.f_code
+        if code.co_filename in files and not code.co_name.startswith('_') \
+                and code.co_name != '<module>':
+            function = code.co_name
+        frame = frame.f_back
+    return function or '(other)'
+
+
+_stats = Stats()
+_swe = None
+_modules = []
+
+
+def enable(modules=default_modules):
+    """Starts recording the ephemeris calls of `modules`"""
+    global _swe, _modules
+    if _swe is not None:
+        return
+    original = modules[0].swe
+    files = set(module.__file__ for module in modules)
+    _swe = InstrumentedSwe(original, _stats, files)
+    _modules = list(modules)
+    for module in _modules:
+        module.swe = _swe
+
+
+def disable():
+    """Stops recording; the modules call swisseph directly again"""
+    global _swe, _modules
+    if _swe is None:
+        return
+    for module in _modules:
+        module.swe = _swe._module
+    _swe, _modules = None, []
+
+
+def enabled(): return _swe is not None
+
+
+@contextmanager
+def instrumented(modules=default_modules):
+    """Records within a `with` block, from a reset start, returning the
+       Stats object"""
+    reset()
+    enable(modules)
+    try:
+        yield _stats
+    finally:
+        disable()
+
+
+def snapshot():
+    """What was recorded so far, as a dict of plain dicts (JSON-ready):
+       calls, seconds and histogram (upper bound in us -> calls) by kind,
+       and calls by kind for each public function"""
+    return _stats.snapshot()
+
+
+def merge(recorded):
+    """Adds to the stats a snapshot() of another process"""
+    _stats.merge(recorded)
+
+
+def reset(): _stats.__init__()
+
+
+def export(fp, prefix='panchanga_ephemeris'):
+    """Writes the recorded stats to file `fp` in the Prometheus text format"""
+    stats = snapshot()
+    fp.write('# TYPE %s_calls_total counter\n' % prefix)
+    for function, calls in sorted(stats['by_function'].items()):
+        for kind, n in sorted(calls.items()):
+            fp.write('%s_calls_total{function="%s",call="%s"} %d\n' %
+                     (prefix, function, kind, n))
+    fp.write('# TYPE %s_seconds histogram\n' % prefix)
+    for kind, buckets in sorted(stats['histogram'].items()):
+        total = 0
+        for upper, n in sorted(buckets.items()):
+            total += n
+            fp.write('%s_seconds_bucket{call="%s",le="%g"} %d\n' %
+                     (prefix, kind, upper / 1e6, total))
+        fp.write('%s_seconds_bucket{call="%s",le="+Inf"} %d\n' %
+                 (prefix, kind, total))
+        fp.write('%s_seconds_sum{call="%s"} %.9f\n' %
+                 (prefix, kind, stats['seconds'][kind]))
+        fp.write('%s_seconds_count{call="%s"} %d\n' % (prefix, kind, total))
+
+# ----- TESTS ------
+
+
+def instrument_tests():
+    import io
+    import time
+    from panchanga import Place, Date, gregorian_to_jd, tithi, masa, daily, \
+        ascendant
+    print(sys._getframe().f_code.co_name)
+    bangalore = Place(12.972, 77.594, +5.5)
+    jd = gregorian_to_jd(Date(2013, 1, 18))
+    birth = 2446225.67360654
+
+    with instrumented() as stats:
+        tithi(jd, bangalore)
+        masa(jd, bangalore)
+        daily(jd, bangalore)
+        ascendant(jd, bangalore)
+        vimsottari.vimsottari_mahadasa(birth)
+    assert(not enabled() and panchanga.swe is vimsottari.swe)
+    recorded = snapshot()
+    assert(set(recorded['by_function']) ==
+           set(['tithi', 'masa', 'daily', 'ascendant', 'vimsottari_mahadasa']))
+    assert(recorded['by_function']['ascendant'] == {'houses_ex': 1})
+    assert(recorded['by_function']['vimsottari_mahadasa'] == {'calc_ut': 1})
+    assert(sum(recorded['calls'].values()) ==
+           sum(sum(calls.values())
+               for calls in recorded['by_function'].values()))
+    for kind, buckets in recorded['histogram'].items():
+        assert(sum(buckets.values()) == recorded['calls'][kind])
+    json.dumps(recorded)
+    out = io.StringIO()
+    export(out)
+    assert('function="masa",call="calc_ut"' in out.getvalue())
+    reset()
+    assert(snapshot()['calls'] == {})
+    merge(recorded)
+    merge(recorded)
+    assert(snapshot()['calls'] == dict((kind, 2 * n) for kind, n in
+                                       recorded['calls'].items()))
+    buckets = recorded['histogram']['calc_ut']
+    assert(snapshot()['histogram']['calc_ut'] ==
+           dict((upper, 2 * n) for upper, n in buckets.items()))
+    reset()
+
+    def timed(n=200):
+        start = time.time()
+        for i in range(n):
+            tithi(jd, bangalore)
+        return (time.time() - start) / n * 1e6
+    plain = timed()
+    with instrumented():
+        traced = timed()
+    print("tithi: %.0f us plain, %.0f us instrumented" % (plain, traced))
+
+
+if __name__ == "__main__":
+    instrument_tests()
@@ -0,0 +1,309 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# lagna.py -- fast ascendant from sidereal time, and the lagnas of a day
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+The ascendant depends on the place only through its latitude and local
+sidereal time; the rest (Greenwich sidereal time, obliquity of the ecliptic,
+ayanamsa with nutation) depends on time alone and changes smoothly. A
+LagnaEngine tabulates those once per day of a span, for the ayanamsa then in
+effect, and interpolates them; the ascendant itself is then a closed formula
+instead of a houses_ex() call. Interpolation errors grow toward the polar
+circles: about 0.002" in the tropics, 0.02" at 60° and under 0.3" near the
+circles, where the ascendant moves at least 4" per second of time.
+
+    engine = LagnaEngine.build(jd_start, jd_end)
+    engine.verify()                       # max error (arc-seconds)
+    panchanga.use_lagna_engine(engine)    # ascendant(), Chart
+    lagna_timeline(jd, place)             # the lagnas of a day
+
+Beyond the polar circles, outside its span or under another ayanamsa, the
+engine declines (returns None) and houses_ex() is used.
+"""
+
+from __future__ import division
+from math import sin, cos, tan, atan2, radians, degrees
+import numpy as np
+import swisseph as swe
+import panchanga
+from panchanga import get_ayanamsa_mode
+
+# Mean rate of Greenwich sidereal time (degrees per day)
+sidereal_rate = 360.98564736629
+
+
+def _node(jd):
+    """Greenwich apparent sidereal time, true obliquity (degrees) and the
+       ayanamsa as houses_ex() subtracts it (with nutation) at `jd` (UT)"""
+    nutation = swe.calc_ut(jd, swe.ECL_NUT)[0]
+    return [swe.sidtime(jd) * 15, nutation[0],
+            swe.get_ayanamsa_ut(jd) + nutation[2]]
+
+
+def _ascendant(armc, latitude, obliquity):
+    """Tropical ascendant (degrees) for ARMC, latitude and obliquity"""
+    armc, obliquity = radians(armc), radians(obliquity)
+    return degrees(atan2(cos(armc), -(sin(armc) * cos(obliquity) +
+                                      tan(radians(latitude)) *
+                                      sin(obliquity)))) % 360
+
+
+class LagnaEngine(object):
+    """Sidereal time, obliquity and ayanamsa at every `step` days from
+       `start` (JD, UT); `nodes` is a float64 array of shape (n, 3)"""
+
+    def __init__(self, start, step, ayanamsa, nodes):
+        self.start = start
+        self.step = step
+        self.end = start + step * (len(nodes) - 1)
+        self.ayanamsa = ayanamsa
+        self.nodes = nodes
+        # Beyond this latitude some ecliptic points never rise, and
+        # houses_ex() reports the ascendant by another convention
+        self.max_latitude = 90 - nodes[:, 1].max()
+
+    @classmethod
+    def build(cls, start, end, step=1.0):
+        """Tabulates the span `start` to `end` (JD, UT) for the current
+           ayanamsa; 3 ephemeris calls per node"""
+        count = int(np.ceil((end - start) / step)) + 1
+        nodes = np.array([_node(start + i * step) for i in range(count)],
+                         dtype=np.float64)
+        return cls(start, step, get_ayanamsa_mode(), nodes)
+
+    def _epoch(self, jd):
+        """Interpolated sidereal time, obliquity and ayanamsa at `jd`, or
+           None if it does not apply"""
+        if not self.start <= jd < self.end or \
+                get_ayanamsa_mode() != self.ayanamsa:
+            return None
+        i, t = divmod(jd - self.start, self.step)
+        i = int(i)
+        f = t / self.step
+        (gast0, eps0, ayan0), (gast1, eps1, ayan1) = \
+            self.nodes[i].tolist(), self.nodes[i + 1].tolist()
+        # The residue of sidereal time over its mean rate is smooth
+        drift = (gast1 - gast0 - sidereal_rate * self.step + 180) % 360 - 180
+        return (gast0 + sidereal_rate * t + drift * f,
+                eps0 + (eps1 - eps0) * f, ayan0 + (ayan1 - ayan0) * f)
+
+    def lagna(self, jd, latitude, longitude):
+        """Nirayana ascendant (degrees) at `jd` (UT), as houses_ex() with
+           FLG_SIDEREAL gives it, or None"""
+        if abs(latitude) >= self.max_latitude:
+            return None
+        epoch = self._epoch(jd)
+        if epoch is None:
+            return None
+        gast, obliquity, ayanamsa = epoch
+        return (_ascendant(gast + longitude, latitude, obliquity) -
+                ayanamsa) % 360
+
+    def lagnas(self, jds, latitudes, longitudes):
+        """Nirayana ascendants at each of `jds` (UT) and places, all within
+           the span and the polar circles"""
+        jds = np.asarray(jds, dtype=np.float64)
+        i, t = np.divmod(jds - self.start, self.step)
+        i = i.astype(np.intp)
+        f = t / self.step
+        a, b = self.nodes[i], self.nodes[i + 1]
+        drift = (b[:, 0] - a[:, 0] - sidereal_rate * self.step + 180) % 360 \
+            - 180
+        armc = np.radians(a[:, 0] + sidereal_rate * t + drift * f +
+                          np.asarray(longitudes))
+        obliquity = np.radians(a[:, 1] + (b[:, 1] - a[:, 1]) * f)
+        ayanamsa = a[:, 2] + (b[:, 2] - a[:, 2]) * f
+        ascendant = np.degrees(np.arctan2(
+            np.cos(armc), -(np.sin(armc) * np.cos(obliquity) +
+                            np.tan(np.radians(latitudes)) *
+                            np.sin(obliquity))))
+        return (ascendant - ayanamsa) % 360
+
+    def verify(self, samples=10000, seed=1):
+        """Maximum error (arc-seconds) against houses_ex() at `samples`
+           random instants and places within the polar circles"""
+        rnd = np.random.RandomState(seed)
+        jds = rnd.uniform(self.start, self.end, samples)
+        lats = rnd.uniform(-self.max_latitude, self.max_latitude, samples)
+        lons = rnd.uniform(-180, 180, samples)
+        truth = np.array([swe.houses_ex(jd, lat, lon,
+                                        flag=swe.FLG_SIDEREAL)[1][0]
+                          for jd, lat, lon in zip(jds.tolist(), lats.tolist(),
+                                                  lons.tolist())])
+        errors = (self.lagnas(jds, lats, lons) - truth + 180) % 360 - 180
+        return np.abs(errors).max() * 3600
+
+
+def _exact(jd, latitude, longitude):
+    return swe.houses_ex(jd, latitude, longitude, flag=swe.FLG_SIDEREAL)[1][0]
+
+
+def lagna_timeline(jd, place, engine=None, exact=False):
+    """The lagnas of the local day `jd`: [sign, start, end] (local JD) for
+       each sign rising during it, the first and last with their times of
+       rising and setting outside the day (bounded by the scan, 12 hours
+       before and after, if not found there). Uses `engine` (default: the one
+       in use by panchanga, else one built for these days with 15 ephemeris
+       calls). With `exact`, each change is refined with houses_ex() to
+       full precision, usually one call each."""
+    lat, lon, tz = place
+    start = jd - tz / 24 - 0.5  # UT; a sign rises within 12 hours
+    end = start + 2
+    engine = engine or panchanga._lagna_engine
+    if engine is None or engine._epoch(start) is None or \
+            engine._epoch(end) is None:
+        engine = LagnaEngine.build(start - 1, end + 1)
+    if abs(lat) >= engine.max_latitude:
+        raise ValueError("no lagna timeline beyond the polar circles")
+    sign = lambda t: int(engine.lagna(t, lat, lon) // 30)
+
+    # Signs change where the ascendant crosses a multiple of 30°. Steps of
+    # 4 minutes are shorter than the rising of any sign below 65° latitude;
+    # toward the polar circles, Meena and Mesha rise within a minute
+    step = 1 / 360. if abs(lat) < 65 else 1 / 86400.
+    changes = []
+    t, current = start, sign(start)
+    while t < end:
+        t_next = min(t + step, end)
+        s = sign(t_next)
+        if s != current:
+            lo, hi = t, t_next
+            while hi - lo > 1e-8:  # ~1 ms
+                mid = (lo + hi) / 2
+                if sign(mid) == current:
+                    lo = mid
+                else:
+                    hi = mid
+            changes.append(((lo + hi) / 2, s))
+            current = s
+        t = t_next
+
+    # The ends of the scan stand in for changes it did not reach, so that a
+    # sign rising all day still has its segment
+    changes = [(start, sign(start))] + changes + [(end, None)]
+    local = tz / 24
+    day_start, day_end = jd - local, jd + 1 - local
+    inside = [k for k in range(len(changes) - 1)
+              if changes[k + 1][0] > day_start and changes[k][0] < day_end]
+    changes = changes[inside[0]:inside[-1] + 2]
+
+    if exact:
+        refined = []
+        for t, s in changes:
+            if t in (start, end):
+                refined.append((t, s))
+                continue
+            boundary = s * 30
+            for i in range(5):  # Newton's method
+                error = (_exact(t, lat, lon) - boundary + 180) % 360 - 180
+                rate = ((engine.lagna(t + 1e-4, lat, lon) -
+                         engine.lagna(t - 1e-4, lat, lon) + 180) % 360 -
+                        180) / 2e-4
+                t -= error / rate
+                if abs(error) < 1e-4:  # now within ~1e-10 degrees
+                    break
+            refined.append((t, s))
+        changes = refined
+
+    return [[s, t0 + local, t1 + local]
+            for (t0, s), (t1, _) in zip(changes, changes[1:])]
+
+# ----- TESTS ------
+
+
+def lagna_tests():
+    import time
+    import instrument
+    from panchanga import Date, Place, gregorian_to_jd, ascendant, \
+        use_lagna_engine
+    from chart import Chart
+    print(sys._getframe().f_code.co_name)
+    modules = instrument.default_modules + [sys.modules[__name__]]
+    bangalore = Place(12.972, 77.594, +5.5)
+    helsinki = Place(60.17, 24.935, +2.0)
+    start = gregorian_to_jd(Date(2015, 1, 1))
+    t = time.time()
+    engine = LagnaEngine.build(start, start + 366)
+    print("1 year tabulated in %.2f s" % (time.time() - t))
+    error = engine.verify()
+    print("max error %.2g arc-seconds" % error)
+    assert(error < 1)
+
+    jd = swe.julday(2015, 9, 25, 13 + 29/60. + 13/3600.)
+    expected = ascendant(jd, bangalore)
+    chart = Chart(jd, bangalore)
+    use_lagna_engine(engine)
+    try:
+        with instrument.instrumented():
+            assert(ascendant(jd, bangalore) == expected ==
+                   [8, [20, 23, 31], [20, 3]])
+            assert(abs(Chart(jd, bangalore).lagna - chart.lagna) < 1e-6)
+        assert('houses_ex' not in instrument.snapshot()['calls'])
+        assert(engine.lagna(jd, 70.0, 25.0) is None)
+        with panchanga.ayanamsa_session(swe.SIDM_RAMAN):
+            assert(engine.lagna(jd, 12.972, 77.594) is None)
+    finally:
+        use_lagna_engine(None)
+
+    n = 100000
+    rnd = np.random.RandomState(2)
+    jds = rnd.uniform(start, start + 365, n)
+    lats = rnd.uniform(-60, 60, n)
+    lons = rnd.uniform(-180, 180, n)
+    t = time.time()
+    engine.lagnas(jds, lats, lons)
+    fast = time.time() - t
+    t = time.time()
+    for i in range(2000):
+        _exact(jds[i], lats[i], lons[i])
+    slow = (time.time() - t) / 2000 * n
+    print("%d lagnas: %.3f s (houses_ex: %.2f s)" % (n, fast, slow))
+
+    for jd, place in [(gregorian_to_jd(Date(2015, 9, 25)), bangalore),
+                      (gregorian_to_jd(Date(2013, 6, 21)), helsinki)]:
+        with instrument.instrumented(modules):
+            t = time.time()
+            timeline = lagna_timeline(jd, place)
+            elapsed = time.time() - t
+        calls = sum(instrument.snapshot()['calls'].values())
+        with instrument.instrumented(modules):
+            exact = lagna_timeline(jd, place, exact=True)
+        exact_calls = instrument.snapshot()['calls']['houses_ex']
+        assert([s for s, t0, t1 in timeline] == [s for s, t0, t1 in exact])
+        assert(timeline[0][1] < jd < timeline[0][2])
+        assert(timeline[-1][1] < jd + 1 < timeline[-1][2])
+        for (s0, a0, b0), (s1, a1, b1) in zip(timeline, timeline[1:]):
+            assert(b0 == a1 and s1 == (s0 + 1) % 12)
+        for (s, t0, t1), (_, e0, e1) in zip(timeline, exact):
+            assert(abs(t0 - e0) < 1e-6 and abs(t1 - e1) < 1e-6)  # 0.1 s
+            # Just after the exact start, the lagna is the sign
+            ut = e0 - place.timezone / 24
+            assert(int(_exact(ut + 1e-6, place.latitude,
+                              place.longitude) // 30) == s)
+            assert(int(_exact(ut - 1e-6, place.latitude,
+                              place.longitude) // 30) == (s - 1) % 12)
+        print("%d lagnas of the day in %.1f ms, %d ephemeris calls "
+              "(exact: %d houses_ex)" % (len(timeline), elapsed * 1e3, calls,
+                                         exact_calls))
+
+
+if __name__ == "__main__":
+    import sys
+    lagna_tests()
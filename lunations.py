@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# lunations.py -- precomputed table of new moons, full moons and sankrantis
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Lunations (new moon to new moon) and solar months (sankranti to sankranti)
+computed once for a span of years, so that masa becomes a binary search.
+
+    table = LunationTable.build(1800, 2200)
+    table.save('lunations.npy')
+    ...
+    table = LunationTable.load('lunations.npy')   # memory-mapped
+    panchanga.use_lunation_table(table)           # masa(), daily(), etc.
+"""
+
+from __future__ import division
+import numpy as np
+import swisseph as swe
+from panchanga import lunar_phase, solar_longitude, raasi, find_angle, \
+    elapsed_year, Lunation
+
+synodic_month = 29.530588853  # mean, in days
+lunar_phase_rate = 360 / synodic_month
+solar_rate = 360 / 365.256363  # mean daily motion of the sun
+
+# Header of the saved file: counts of each array, sign entered at the first
+# sankranti, and the span of the table
+_header = 6
+
+
+def new_moon_near(jd): return find_angle(jd, 'lunar_phase', 0).jd
+
+
+def full_moon_near(jd): return find_angle(jd, 'lunar_phase', 180).jd
+
+
+def sankranti_near(jd, rasi):
+    """Time near `jd` when the sun enters `rasi` (0 = Mesha, ..., 11 = Meena)"""
+    return find_angle(jd, 'sun', rasi * 30).jd
+
+
+class LunationTable(object):
+    """Sorted float64 arrays of JD (UT) of all new moons, full moons and
+       sankrantis between `start` and `end`."""
+
+    def __init__(self, new_moons, full_moons, sankrantis, first_rasi,
+                 start, end):
+        self.new_moons = new_moons
+        self.full_moons = full_moons
+        self.sankrantis = sankrantis
+        self.first_rasi = int(first_rasi)  # sign entered at sankrantis[0]
+        self.start = start
+        self.end = end
+
+    @classmethod
+    def build(cls, start_year=1800, end_year=2200):
+        """Computes the table for 1st Jan of `start_year` to that of `end_year`"""
+        start = swe.julday(start_year, 1, 1, 0.0)
+        end = swe.julday(end_year, 1, 1, 0.0)
+
+        new_moons = []
+        jd = new_moon_near(start - lunar_phase(start) / lunar_phase_rate)
+        while jd < end + synodic_month:
+            new_moons.append(jd)
+            jd = new_moon_near(jd + synodic_month)
+
+        full_moons = [full_moon_near(jd + synodic_month / 2)
+                      for jd in new_moons]
+
+        sankrantis = []
+        first_rasi = int(solar_longitude(start) // 30)
+        rasi = first_rasi
+        jd = start - (solar_longitude(start) % 30) / solar_rate
+        while jd < end + 31:
+            jd = sankranti_near(jd, rasi)
+            sankrantis.append(jd)
+            rasi = (rasi + 1) % 12
+            jd += 30 / solar_rate
+
+        return cls(np.array(new_moons, dtype=np.float64),
+                   np.array(full_moons, dtype=np.float64),
+                   np.array(sankrantis, dtype=np.float64),
+                   first_rasi, start, end)
+
+    def save(self, path):
+        """Saves as a single .npy file, which load() can memory-map"""
+        header = [len(self.new_moons), len(self.full_moons),
+                  len(self.sankrantis), self.first_rasi, self.start, self.end]
+        np.save(path, np.concatenate([np.array(header, dtype=np.float64),
+                                      self.new_moons, self.full_moons,
+                                      self.sankrantis]))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        data = np.load(path, mmap_mode='r' if mmap else None)
+        n_new, n_full, n_sank = [int(n) for n in data[:3]]
+        first_rasi, start, end = data[3:_header]
+        i = _header
+        new_moons = data[i:i + n_new]
+        full_moons = data[i + n_new:i + n_new + n_full]
+        sankrantis = data[i + n_new + n_full:i + n_new + n_full + n_sank]
+        return cls(new_moons, full_moons, sankrantis, first_rasi,
+                   float(start), float(end))
+
+    def covers(self, jd):
+        return len(self.new_moons) > 1 and \
+            self.new_moons[0] <= jd < self.new_moons[-1]
+
+    def rasi(self, jd):
+        """Same as panchanga.raasi(jd) (1 = Mesha, ... 12 = Meena)"""
+        i = np.searchsorted(self.sankrantis, jd, side='right')
+        if i == 0 or i == len(self.sankrantis):
+            return raasi(jd)
+        return (self.first_rasi + i - 1) % 12 + 1
+
+    def lunation(self, critical):
+        """Lunation in which the instant `critical` (JD, UT) falls, usually a
+           sunrise. Instants outside the table are computed on demand."""
+        if self.covers(critical):
+            i = np.searchsorted(self.new_moons, critical, side='right')
+            last_new_moon = float(self.new_moons[i - 1])
+            next_new_moon = float(self.new_moons[i])
+        else:
+            phase = lunar_phase(critical)
+            last_new_moon = new_moon_near(critical - phase / lunar_phase_rate)
+            if last_new_moon > critical:
+                last_new_moon = new_moon_near(last_new_moon - synodic_month)
+            next_new_moon = new_moon_near(last_new_moon + synodic_month)
+
+        this_solar_month = self.rasi(last_new_moon)
+        next_solar_month = self.rasi(next_new_moon)
+        is_leap_month = (this_solar_month == next_solar_month)
+        maasa = this_solar_month % 12 + 1
+        return Lunation(last_new_moon, next_new_moon,
+                        [int(maasa), is_leap_month])
+
+    def masa(self, critical): return self.lunation(critical).masa
+
+    def elapsed_year(self, critical):
+        return elapsed_year(critical, self.masa(critical)[0])
+
+    def full_moon(self, critical):
+        """First full moon at or after `critical`"""
+        i = np.searchsorted(self.full_moons, critical)
+        if 0 < i < len(self.full_moons):
+            return float(self.full_moons[i])
+        jd = full_moon_near(critical + ((180 - lunar_phase(critical)) % 360) /
+                            lunar_phase_rate)
+        return jd if jd >= critical else full_moon_near(jd + synodic_month)
+
+# ----- TESTS ------
+
+
+def table_tests():
+    import os
+    import tempfile
+    from panchanga import Date, Place, gregorian_to_jd, masa, sunrise, \
+        use_lunation_table, new_moon
+    print(sys._getframe().f_code.co_name)
+    bangalore = Place(12.972, 77.594, +5.5)
+    table = LunationTable.build(2012, 2014)
+    path = os.path.join(tempfile.mkdtemp(), 'lunations.npy')
+    table.save(path)
+    table = LunationTable.load(path)
+    assert(isinstance(table.new_moons, np.memmap))
+
+    # New moons agree with panchanga.new_moon() to within a few seconds
+    jd = gregorian_to_jd(Date(2013, 2, 10))
+    nm = table.lunation(jd).last_new_moon
+    assert(abs(nm - new_moon(jd, 30, -1)) * 86400 < 10)
+
+    start = gregorian_to_jd(Date(2012, 4, 1))
+    for jd in range(int(start), int(start) + 400, 3):
+        jd += 0.5
+        expected = masa(jd, bangalore)
+        use_lunation_table(table)
+        assert(masa(jd, bangalore) == expected)
+        use_lunation_table(None)
+
+    # Outside the table: computed on demand
+    jd = gregorian_to_jd(Date(2010, 5, 5))
+    rise = sunrise(jd, bangalore)[0] - bangalore.timezone / 24.
+    assert(table.masa(rise) == masa(jd, bangalore))
+
+
+if __name__ == "__main__":
+    import sys
+    table_tests()
@@ -0,0 +1,381 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# muhurta.py -- search for windows of time meeting panchanga conditions
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Conditions on the angas, the weekday and the kalams of the day each give a
+set of intervals of time; conditions combine with & (and), | (or), - (but
+not) and ~ (not), like the sets they stand for:
+
+    good = Anga('tithi', 2, 3, 5) & Anga('nakshatra', 'Rohini', 'Hasta') & \
+        ~Vaara(2) - (Kalam('rahu') | Kalam('durmuhurtam'))
+    for window in search(good, jd_start, jd_end, place, min_hours=1):
+        ...   # Window(start, end), local JD
+
+Angas change at their transitions (transitions.py), not at sunrise; a vaara
+runs from sunrise to the next sunrise. The range is searched a month at a
+time, so windows are produced as they are found.
+"""
+
+from __future__ import division
+import os
+import json
+import unicodedata
+from collections import namedtuple as struct
+from transitions import TransitionIndex, angas
+from panchanga import SolarDay, vaara
+
+Window = struct('Window', ['start', 'end'])
+
+# Names of the angas in sanskrit_names.json
+_name_keys = {'tithi': 'tithis', 'nakshatra': 'nakshatras', 'yoga': 'yogas',
+              'karana': 'karanas'}
+_names = None
+
+
+def _fold(name):
+    """'Rohiṇī' -> 'rohini'"""
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(c for c in decomposed
+                   if not unicodedata.combining(c)).lower()
+
+
+def anga_number(anga, name):
+    """Number of the anga of given name (diacritics and case ignored)"""
+    global _names
+    if _names is None:
+        with open(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                               'sanskrit_names.json')) as fp:
+            _names = json.load(fp)
+    for number, full_name in _names[_name_keys[anga]].items():
+        if _fold(full_name) == _fold(name):
+            return int(number)
+    raise ValueError("no %s named %r" % (anga, name))
+
+
+class IntervalSet(object):
+    """Disjoint intervals [start, end), as a sorted list of (start, end)"""
+
+    def __init__(self, intervals=()):
+        self.intervals = _merge(sorted(intervals))
+
+    def __iter__(self): return iter(self.intervals)
+
+    def __len__(self): return len(self.intervals)
+
+    def __eq__(self, other): return self.intervals == other.intervals
+
+    def __repr__(self): return 'IntervalSet(%r)' % self.intervals
+
+    def duration(self): return sum(end - start for start, end in self)
+
+    def __or__(self, other):
+        result = IntervalSet()
+        result.intervals = _merge(sorted(self.intervals + other.intervals))
+        return result
+
+    def __and__(self, other):
+        a, b = self.intervals, other.intervals
+        result = []
+        i = j = 0
+        while i < len(a) and j < len(b):
+            start = max(a[i][0], b[j][0])
+            end = min(a[i][1], b[j][1])
+            if start < end:
+                result.append((start, end))
+            if a[i][1] < b[j][1]:
+                i += 1
+            else:
+                j += 1
+        s = IntervalSet()
+        s.intervals = result
+        return s
+
+    def __sub__(self, other):
+        result = []
+        j = 0
+        b = other.intervals
+        for start, end in self.intervals:
+            while j < len(b) and b[j][1] <= start:
+                j += 1
+            k = j
+            while k < len(b) and b[k][0] < end:
+                if b[k][0] > start:
+                    result.append((start, b[k][0]))
+                start = max(start, b[k][1])
+                k += 1
+            if start < end:
+                result.append((start, end))
+        s = IntervalSet()
+        s.intervals = result
+        return s
+
+    def complement(self, start, end):
+        """The intervals of [start, end) not in this set"""
+        return IntervalSet([(start, end)]) - self
+
+
+def _merge(intervals):
+    """Sorted intervals with overlapping or touching ones joined"""
+    merged = []
+    for start, end in intervals:
+        if start >= end:
+            continue
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class Span(object):
+    """A range of time (JD, UT) at a place, with what conditions need of
+       it: the transitions of the angas and the solar days, both found once
+       on first use"""
+
+    def __init__(self, start, end, place):
+        self.start = start
+        self.end = end
+        self.place = place
+        self._index = self._days = None
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._index = TransitionIndex.build(self.start, self.end)
+        return self._index
+
+    @property
+    def days(self):
+        """SolarDay of each date from the day before the span to its end;
+           each day's next sunrise is the following day's sunrise"""
+        if self._days is None:
+            tz = self.place.timezone
+            first = int(self.start + tz / 24 - 0.5) + 0.5 - 1
+            self._days = [SolarDay(first, self.place)]
+            for i in range(int(self.end + tz / 24 - first)):
+                self._days.append(self._days[-1].following())
+        return self._days
+
+    def clip(self, intervals):
+        """IntervalSet of `intervals` within the span"""
+        return IntervalSet((max(start, self.start), min(end, self.end))
+                           for start, end in intervals)
+
+
+class Condition(object):
+    """Holds at the times of intervals(span), an IntervalSet"""
+
+    def __and__(self, other): return _Combined(self, other, '&')
+
+    def __or__(self, other): return _Combined(self, other, '|')
+
+    def __sub__(self, other): return _Combined(self, other, '-')
+
+    def __invert__(self): return _Not(self)
+
+
+class _Combined(Condition):
+
+    def __init__(self, left, right, operator):
+        self.left = left
+        self.right = right
+        self.operator = operator
+
+    def intervals(self, span):
+        left = self.left.intervals(span)
+        if self.operator == '&' and not left:
+            return left
+        right = self.right.intervals(span)
+        return {'&': left & right, '|': left | right,
+                '-': left - right}[self.operator]
+
+    def __repr__(self):
+        return '(%r %s %r)' % (self.left, self.operator, self.right)
+
+
+class _Not(Condition):
+
+    def __init__(self, condition):
+        self.condition = condition
+
+    def intervals(self, span):
+        return self.condition.intervals(span).complement(span.start, span.end)
+
+    def __repr__(self): return '~%r' % self.condition
+
+
+class Anga(Condition):
+    """While the tithi, nakshatra, yoga or karana is one of `numbers`
+       (as numbered by panchanga.py) or names (as in sanskrit_names.json)"""
+
+    def __init__(self, anga, *numbers):
+        if anga not in angas:
+            raise ValueError("unknown anga: %s" % anga)
+        self.anga = anga
+        self.numbers = frozenset(n if isinstance(n, int) else
+                                 anga_number(anga, n) for n in numbers)
+
+    def intervals(self, span):
+        return span.clip((period.start, period.end) for period in
+                         span.index.between(self.anga, span.start, span.end)
+                         if period.number in self.numbers)
+
+    def __repr__(self):
+        return 'Anga(%r, %s)' % (self.anga,
+                                 ', '.join(map(str, sorted(self.numbers))))
+
+
+class Vaara(Condition):
+    """From sunrise to the next sunrise of the weekdays `days`
+       (0 = Sunday, ..., 6 = Saturday)"""
+
+    def __init__(self, *days):
+        self.days = frozenset(days)
+
+    def intervals(self, span):
+        return span.clip((day.sunrise, day.next_sunrise) for day in span.days
+                         if vaara(day.jd) in self.days)
+
+    def __repr__(self):
+        return 'Vaara(%s)' % ', '.join(map(str, sorted(self.days)))
+
+
+class Kalam(Condition):
+    """During rahu, yamaganda or gulika kalam, durmuhurtam or abhijit
+       muhurta, as given by panchanga.SolarDay"""
+
+    kinds = ['rahu', 'yamaganda', 'gulika', 'durmuhurtam', 'abhijit']
+
+    def __init__(self, kind):
+        if kind not in self.kinds:
+            raise ValueError("unknown kalam: %s" % kind)
+        self.kind = kind
+
+    def _periods(self, day):
+        if self.kind == 'durmuhurtam':
+            return day.durmuhurtam_periods
+        if self.kind == 'abhijit':
+            return [day.abhijit_period]
+        return [day.trikalam_period(self.kind)]
+
+    def intervals(self, span):
+        return span.clip(period for day in span.days
+                         for period in self._periods(day))
+
+    def __repr__(self): return 'Kalam(%r)' % self.kind
+
+
+def search(condition, start, end, place, min_hours=0, chunk=30):
+    """Generates the Window (local JD) of every interval from Julian day
+       `start` up to `end` at `place` in which `condition` holds, lasting at
+       least `min_hours`. The range is evaluated `chunk` days at a time."""
+    tz = place.timezone / 24
+    pending = None  # the last window, which may go on in the next chunk
+    t = start - tz
+    while t < end - tz:
+        span = Span(t, min(t + chunk, end - tz), place)
+        for w_start, w_end in condition.intervals(span):
+            if pending is not None:
+                if w_start <= pending[1]:  # continues over the chunks
+                    pending = (pending[0], w_end)
+                    continue
+                if (pending[1] - pending[0]) * 24 >= min_hours:
+                    yield Window(pending[0] + tz, pending[1] + tz)
+            pending = (w_start, w_end)
+        t = span.end
+    if pending is not None and (pending[1] - pending[0]) * 24 >= min_hours:
+        yield Window(pending[0] + tz, pending[1] + tz)
+
+# ----- TESTS ------
+
+
+def muhurta_tests():
+    import time
+    from panchanga import Date, Place, gregorian_to_jd, rahu_kalam, \
+        durmuhurtam, from_dms
+    print(sys._getframe().f_code.co_name)
+    bangalore = Place(12.972, 77.594, +5.5)
+
+    a = IntervalSet([(0, 2), (5, 7), (1, 3)])
+    b = IntervalSet([(2.5, 6), (8, 9)])
+    assert(a.intervals == [(0, 3), (5, 7)])
+    assert((a | b).intervals == [(0, 7), (8, 9)])
+    assert((a & b).intervals == [(2.5, 3), (5, 6)])
+    assert((a - b).intervals == [(0, 2.5), (6, 7)])
+    assert((b - a).intervals == [(3, 5), (8, 9)])
+    assert(a.complement(-1, 10).intervals == [(-1, 0), (3, 5), (7, 10)])
+    assert(a - IntervalSet() == a and not (a & IntervalSet()))
+    assert(anga_number('nakshatra', 'Rohini') == 4)
+    assert(anga_number('nakshatra', 'hasta') == 13)
+
+    jd = gregorian_to_jd(Date(2013, 1, 18))
+    tz = bangalore.timezone
+    hours = lambda t: (t - jd) * 24
+    # Rahu kalam of Friday 18th January, to the second
+    windows = list(search(Kalam('rahu'), jd, jd + 1, bangalore))
+    assert(len(windows) == 1)
+    expected = rahu_kalam(jd, bangalore)
+    for t, dms in zip(windows[0], expected):
+        assert(abs(hours(t) - from_dms(*dms)) < 1 / 3600.)
+    windows = list(search(Kalam('durmuhurtam'), jd, jd + 1, bangalore))
+    starts, ends = durmuhurtam(jd, bangalore)
+    assert(len(windows) == 2)  # Friday has two
+    for w, s, e in zip(windows, starts, ends):
+        assert(abs(hours(w.start) - s) < 1e-6 and abs(hours(w.end) - e) < 1e-6)
+
+    # Windows of a year, checked at their middle against the definition
+    start = gregorian_to_jd(Date(2013, 1, 1))
+    end = start + 365
+    good = Anga('tithi', 2, 3, 5) & \
+        Anga('nakshatra', 'Rohini', 'Hasta', 'Anuradha', 'Revati') & \
+        ~Vaara(2) - (Kalam('rahu') | Kalam('durmuhurtam'))
+    t = time.time()
+    windows = list(search(good, start, end, bangalore))
+    elapsed = time.time() - t
+    assert(windows and all(a.end < b.start
+                           for a, b in zip(windows, windows[1:])))
+    whole = list(search(good, start, end, bangalore, chunk=400))
+    assert(len(whole) == len(windows))
+    assert(all(abs(a.start - b.start) < 1e-6 and abs(a.end - b.end) < 1e-6
+               for a, b in zip(windows, whole)))
+    index = TransitionIndex.build(start - tz / 24, end - tz / 24)
+    for w in windows:
+        mid = (w.start + w.end) / 2 - tz / 24
+        assert(index.at('tithi', mid).number in (2, 3, 5))
+        assert(index.at('nakshatra', mid).number in (4, 13, 17, 27))
+        date = int(mid + tz / 24 - 0.5) + 0.5
+        day = SolarDay(date, bangalore)
+        if mid < day.sunrise:
+            day = SolarDay(date - 1, bangalore)
+        assert(vaara(day.jd) != 2)
+        for s, e in [day.trikalam_period('rahu')] + day.durmuhurtam_periods:
+            assert(not s < mid < e)
+    print("%d windows in a year, found in %.2f s" % (len(windows), elapsed))
+
+    long_ones = list(search(good, start, end, bangalore, min_hours=3))
+    assert(0 < len(long_ones) < len(windows))
+    assert(all((w.end - w.start) * 24 >= 3 for w in long_ones))
+
+
+if __name__ == "__main__":
+    import sys
+    muhurta_tests()
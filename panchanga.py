@@ -27,8 +27,11 @@ Use Swiss ephemeris to calculate tithi, nakshatra, etc.
 """
 
 from __future__ import division
-from math import ceil
+from math import ceil, floor, sin, cos, asin, radians, degrees
 from collections import namedtuple as struct
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import repeat
 import swisseph as swe
 
 Date = struct('Date', ['year', 'month', 'day'])
@@ -40,6 +43,13 @@ sidereal_year = 365.256360417   # From WolframAlpha
 # They are geomretic, i.e. "true sunrise/set", so refraction is not considered
 _rise_flags = swe.BIT_DISC_CENTER + swe.BIT_NO_REFRACTION
 
+_sidereal_flags = swe.FLG_SWIEPH | swe.FLG_SIDEREAL
+# Without nutation, to match the mean ayanamsa of swe.get_ayanamsa_ut()
+_tropical_flags = swe.FLG_SWIEPH | swe.FLG_NONUT
+
+# Offsets (in days) from sunrise at which the angas sample the sun and moon
+_sample_offsets = [0.0, 0.25, 0.5, 0.75, 1.0]
+
 # namah suryaya chandraya mangalaya ... rahuve ketuve namah
 swe.KETU = swe.PLUTO  # I've mapped Pluto to Ketu
 planet_list = [swe.SUN, swe.MOON, swe.MARS, swe.MERCURY, swe.JUPITER,
@@ -47,18 +57,60 @@ planet_list = [swe.SUN, swe.MOON, swe.MARS, swe.MERCURY, swe.JUPITER,
                swe.KETU, swe.URANUS, swe.NEPTUNE]
 
 
-def revati_359_50(): return swe.set_sid_mode(
-    swe.SIDM_USER, 1926892.343164331, 0)
+# Ayanamsa used for all sidereal computations. It is applied to the Swiss
+# ephemeris once, by set_ayanamsa_mode(), and not around every single call.
+# With `tropical` set, longitudes are computed as tropical longitude minus
+# swe.get_ayanamsa_ut(), which never touches the sidereal mode at all.
+Ayanamsa = struct('Ayanamsa', ['mode', 't0', 'ayan_t0', 'tropical'])
+_ayanamsa = None
+
+
+def set_ayanamsa_mode(mode=swe.SIDM_LAHIRI, t0=0, ayan_t0=0, tropical=False):
+    """Selects the ayanamsa for all subsequent computations (default Lahiri).
+       `t0` and `ayan_t0` are used only for mode = swe.SIDM_USER"""
+    global _ayanamsa
+    _ayanamsa = Ayanamsa(mode, t0, ayan_t0, tropical)
+    swe.set_sid_mode(mode, t0, ayan_t0)
+    return _ayanamsa
+
+
+def reset_ayanamsa_mode():
+    """Goes back to the default ayanamsa (Lahiri) the module starts with"""
+    return set_ayanamsa_mode()
+
+
+def get_ayanamsa_mode():
+    """Returns the Ayanamsa in effect"""
+    return _ayanamsa
+
+
+@contextmanager
+def ayanamsa_session(mode=swe.SIDM_LAHIRI, t0=0, ayan_t0=0, tropical=False):
+    """Use given ayanamsa within a `with` block, restoring the previous one
+       on exit. The sidereal mode is changed only on entry and on exit."""
+    previous = _ayanamsa
+    set_ayanamsa_mode(mode, t0, ayan_t0, tropical)
+    try:
+        yield _ayanamsa
+    finally:
+        set_ayanamsa_mode(*previous)
 
 
-def galc_cent_mid_mula(): return swe.set_sid_mode(
-    swe.SIDM_USER, 1922011.128853056, 0)
+# These two select their ayanamsa for all subsequent computations, as
+# set_ayanamsa_mode() does; use ayanamsa_session() for a temporary change
 
 
-def set_ayanamsa_mode(): return swe.set_sid_mode(swe.SIDM_LAHIRI)
+def revati_359_50():
+    """Selects the ayanamsa placing Revati at 359°50'"""
+    return set_ayanamsa_mode(swe.SIDM_USER, 1926892.343164331, 0)
 
 
-def reset_ayanamsa_mode(): return swe.set_sid_mode(swe.SIDM_FAGAN_BRADLEY)
+def galc_cent_mid_mula():
+    """Selects the ayanamsa placing the galactic centre mid-Mula"""
+    return set_ayanamsa_mode(swe.SIDM_USER, 1922011.128853056, 0)
+
+
+set_ayanamsa_mode()
 
 # Temporary function
 
@@ -117,17 +169,17 @@ def ketu(rahu): return (rahu + 180) % 360
 
 
 def function(point):
-    swe.set_sid_mode(swe.SIDM_USER, point, 0.0)
-    # swe.set_sid_mode(swe.SIDM_LAHIRI)
-    # Place Revati at 359°50'
-    #fval = norm180(swe.fixstar_ut("Revati", point, flag = swe.FLG_SWIEPH | swe.FLG_SIDEREAL)[0]) - ((359 + 49/60 + 59/3600) - 360)
-    # Place Revati at 0°0'0"
-    #fval = norm180(swe.fixstar_ut("Revati", point, flag = swe.FLG_SWIEPH | swe.FLG_SIDEREAL)[0])
-    # Place Citra at 180°
-    fval = swe.fixstar_ut("Citra", point, flag=swe.FLG_SWIEPH | swe.FLG_SIDEREAL)[
-        0] - (180)
-    # Place Pushya (delta Cancri) at 106°
-    # fval = swe.fixstar_ut(",deCnc", point, flag = swe.FLG_SWIEPH | swe.FLG_SIDEREAL)[0] - (106)
+    # The trial ayanamsa applies only here; the previous one is restored
+    with ayanamsa_session(swe.SIDM_USER, point, 0.0):
+        # Place Revati at 359°50'
+        #fval = norm180(swe.fixstar_ut("Revati", point, flag = swe.FLG_SWIEPH | swe.FLG_SIDEREAL)[0]) - ((359 + 49/60 + 59/3600) - 360)
+        # Place Revati at 0°0'0"
+        #fval = norm180(swe.fixstar_ut("Revati", point, flag = swe.FLG_SWIEPH | swe.FLG_SIDEREAL)[0])
+        # Place Citra at 180°
+        fval = swe.fixstar_ut("Citra", point,
+                              flag=swe.FLG_SWIEPH | swe.FLG_SIDEREAL)[0] - (180)
+        # Place Pushya (delta Cancri) at 106°
+        # fval = swe.fixstar_ut(",deCnc", point, flag = swe.FLG_SWIEPH | swe.FLG_SIDEREAL)[0] - (106)
     return fval
 
 
@@ -201,40 +253,170 @@ def nakshatra_pada(longitude):
 
 def sidereal_longitude(jd, planet):
     """Computes nirayana (sidereal) longitude of given planet on jd"""
-    set_ayanamsa_mode()
-    longi = swe.calc_ut(jd, planet, flag=swe.FLG_SWIEPH | swe.FLG_SIDEREAL)[0]
-    reset_ayanamsa_mode()
+    if _longitude_engine is not None:
+        longi = _longitude_engine.longitude(jd, planet)
+        if longi is not None:
+            return longi
+
+    cache = _longitude_cache
+    if cache is None:
+        return _sidereal_longitude(jd, planet)
+
+    key = (jd, planet, _ayanamsa)
+    longi = cache.get(key)
+    if longi is None:
+        longi = _sidereal_longitude(jd, planet)
+        cache.put(key, longi)
+    return longi
+
+
+def _sidereal_longitude(jd, planet):
+    if _ayanamsa.tropical:
+        longi = swe.calc_ut(jd, planet, flag=_tropical_flags)[0]
+        return norm360(longi[0] - swe.get_ayanamsa_ut(jd))
+    longi = swe.calc_ut(jd, planet, flag=_sidereal_flags)[0]
     return norm360(longi[0])  # degrees
 
 
+_longitude_engine = None
+
+
+def use_longitude_engine(engine):
+    """Take longitudes (and motions) from `engine`, e.g. a chebyshev.
+       ChebyshevEphemeris, wherever its longitude() or motion() do not
+       return None. None goes back to the Swiss ephemeris alone."""
+    global _longitude_engine
+    _longitude_engine = engine
+
+
+# ----- Longitude cache ------
+# Opt-in memoization of sidereal_longitude(), for long running processes
+# which compute the same dates (and hence the same longitudes) repeatedly.
+
+CacheInfo = struct('CacheInfo', ['hits', 'misses', 'evictions',
+                                 'maxsize', 'currsize'])
+
+
+class LongitudeCache(object):
+    """Bounded LRU map of (jd, planet, ayanamsa) to longitude.
+
+       `misses` is the number of Swiss ephemeris calls made on its behalf.
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self.clear()
+
+    def get(self, key):
+        value = self._store.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self._store.move_to_end(key)  # most recently used
+        return value
+
+    def put(self, key, value):
+        self._store[key] = value
+        self._evict()
+
+    def resize(self, maxsize):
+        self.maxsize = maxsize
+        self._evict()
+
+    def _evict(self):
+        while len(self._store) > self.maxsize:
+            self._store.popitem(last=False)  # least recently used
+            self.evictions += 1
+
+    def clear(self):
+        self._store = OrderedDict()
+        self.hits = self.misses = self.evictions = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.evictions,
+                         self.maxsize, len(self._store))
+
+
+_longitude_cache = None
+
+
+def enable_longitude_cache(maxsize=4096):
+    """Memoize sidereal_longitude() in an LRU cache of `maxsize` entries.
+       If the cache is already enabled, it is only resized."""
+    global _longitude_cache
+    if _longitude_cache is None:
+        _longitude_cache = LongitudeCache(maxsize)
+    else:
+        _longitude_cache.resize(maxsize)
+
+
+def disable_longitude_cache():
+    global _longitude_cache
+    _longitude_cache = None
+
+
+def clear_longitude_cache():
+    """Drops all cached longitudes and resets the counters"""
+    if _longitude_cache is not None:
+        _longitude_cache.clear()
+
+
+def longitude_cache_info():
+    """Returns CacheInfo(hits, misses, evictions, maxsize, currsize),
+       or None if the cache is disabled"""
+    if _longitude_cache is not None:
+        return _longitude_cache.info()
+
+
+def sidereal_motion(jd, planet):
+    """Nirayana longitude of given planet on jd and its daily motion, both
+       in degrees, from a single ephemeris call"""
+    if _longitude_engine is not None:
+        motion = _longitude_engine.motion(jd, planet)
+        if motion is not None:
+            return motion
+    if _ayanamsa.tropical:
+        xx = swe.calc_ut(jd, planet, flag=_tropical_flags | swe.FLG_SPEED)[0]
+        return norm360(xx[0] - swe.get_ayanamsa_ut(jd)), xx[3]
+    xx = swe.calc_ut(jd, planet, flag=_sidereal_flags | swe.FLG_SPEED)[0]
+    return norm360(xx[0]), xx[3]
+
+
 def solar_longitude(jd): return sidereal_longitude(jd, swe.SUN)
 
 
 def lunar_longitude(jd): return sidereal_longitude(jd, swe.MOON)
 
 
-def sunrise(jd, place):
-    """Sunrise when centre of disc is at horizon for given date and place"""
+def _sun_event(jd, place, event):
+    """JD (UT) of sunrise or sunset, event = swe.CALC_RISE or swe.CALC_SET"""
     lat, lon, tz = place
     result = swe.rise_trans(jd - tz/24, swe.SUN, lon,
-                            lat, rsmi=_rise_flags + swe.CALC_RISE)
-    rise = result[1][0]  # julian-day number
+                            lat, rsmi=_rise_flags + event)
+    return result[1][0]  # julian-day number
+
+
+def sunrise(jd, place):
+    """Sunrise when centre of disc is at horizon for given date and place"""
+    tz = place.timezone
+    rise = _sun_event(jd, place, swe.CALC_RISE)
     # Convert to local time
     return [rise + tz/24., to_dms((rise - jd) * 24 + tz)]
 
 
 def sunset(jd, place):
     """Sunset when centre of disc is at horizon for given date and place"""
-    lat, lon, tz = place
-    result = swe.rise_trans(jd - tz/24, swe.SUN, lon,
-                            lat, rsmi=_rise_flags + swe.CALC_SET)
-    setting = result[1][0]  # julian-day number
+    tz = place.timezone
+    setting = _sun_event(jd, place, swe.CALC_SET)
     # Convert to local time
     return [setting + tz/24., to_dms((setting - jd) * 24 + tz)]
 
 
 def moonrise(jd, place):
-    """Moonrise when centre of disc is at horizon for given date and place"""
+    """Moonrise when centre of disc is at horizon for given date and place.
+       If the moon does not rise that day, this is the next day's moonrise
+       (past 24:00); see moon_table() for the JD of every rise and set."""
     lat, lon, tz = place
     result = swe.rise_trans(jd - tz/24, swe.MOON, lon,
                             lat, rsmi=_rise_flags + swe.CALC_RISE)
@@ -244,7 +426,8 @@ def moonrise(jd, place):
 
 
 def moonset(jd, place):
-    """Moonset when centre of disc is at horizon for given date and place"""
+    """Moonset when centre of disc is at horizon for given date and place.
+       Past 24:00 if the moon does not set that day (see moonrise())"""
     lat, lon, tz = place
     result = swe.rise_trans(jd - tz/24, swe.MOON, lon,
                             lat, rsmi=_rise_flags + swe.CALC_SET)
@@ -252,6 +435,107 @@ def moonset(jd, place):
     # Convert to local time
     return to_dms((setting - jd) * 24 + tz)
 
+
+# Mean interval between two moonrises (or moonsets), 24h 50m, in days
+_lunar_day = 1.0347
+_moon_flags = swe.FLG_SWIEPH | swe.FLG_EQUATORIAL | swe.FLG_TOPOCTR
+
+
+def _moon_altitude(jd, place):
+    """Topocentric altitude of the moon's centre (degrees, no refraction)
+       at jd (UT), and roughly its rate (degrees/day), taking the moon's
+       mean motion in right ascension only; needs swe.set_topo(place)"""
+    lat = radians(place.latitude)
+    ra, dec = swe.calc_ut(jd, swe.MOON, flag=_moon_flags)[0][:2]
+    hour_angle = radians(swe.sidtime(jd) * 15 + place.longitude - ra)
+    dec = radians(dec)
+    alt = asin(sin(lat) * sin(dec) + cos(lat) * cos(dec) * cos(hour_angle))
+    rate = -cos(lat) * cos(dec) * sin(hour_angle) * 347.81 / cos(alt)
+    return degrees(alt), rate
+
+
+def _moon_event(last, guess, place, event):
+    """The moon's rise or set (JD, UT) following the one at `last`, by the
+       secant method from `guess`; None if that does not find an event of
+       the right kind within a few hours of it"""
+    jd, (alt, rate) = guess, _moon_altitude(guess, place)
+    for i in range(8):
+        if (rate > 0) != (event == swe.CALC_RISE):
+            return None
+        step = alt / rate
+        previous, previous_alt = jd, alt
+        jd -= step
+        if abs(step) < 1e-7:  # ~0.01 s
+            return jd if last + 0.5 < jd < last + 1.6 else None
+        alt, approximate = _moon_altitude(jd, place)
+        rate = (alt - previous_alt) / (jd - previous) if alt != previous_alt \
+            else approximate
+    return None
+
+
+def _moon_events(start, end, place, event, seeded=True):
+    """Generates the JD (UT) of every rise or set of the moon from `start`
+       up to `end`. With `seeded`, each is searched from the previous one
+       plus the last interval between them (at first a lunar day; see
+       _moon_event()), falling back to swe.rise_trans()"""
+    lat, lon, tz = place
+
+    def search(jd):
+        while jd < end:
+            result = swe.rise_trans(jd, swe.MOON, lon, lat,
+                                    rsmi=_rise_flags + event)
+            if result[0] != -2:
+                return result[1][0]
+            jd += 1  # circumpolar (or never rising) that day
+        return end
+
+    jd = search(start)
+    interval = _lunar_day
+    while jd < end:
+        yield jd
+        following = _moon_event(jd, jd + interval, place, event) \
+            if seeded else None
+        if following is None:
+            following = search(jd + 1e-3)
+        interval = following - jd if following - jd < 1.2 else _lunar_day
+        jd = following
+
+
+# Local JD of moonrise and of moonset on day `jd`, None if there is none
+MoonDay = struct('MoonDay', ['jd', 'moonrise', 'moonset'])
+
+
+def moon_table(start, end, place):
+    """MoonDay of each day from Julian day `start` up to, but not including,
+       `end` at given place (use it a month or more at a time).
+
+       The moon rises and sets about 50 minutes later each day, so about
+       once a month it does not rise (or set) on a given day; that day's
+       moonrise (or moonset) is None. On the rare day with two, the first
+       is given.
+    """
+    tz = place.timezone
+    start_ut, end_ut = start - tz / 24, end - tz / 24
+    swe.set_topo(place.longitude, place.latitude, 0)
+    events = {}
+    for seeded in (True, False):
+        for event in (swe.CALC_RISE, swe.CALC_SET):
+            events[event] = list(_moon_events(start_ut, end_ut, place, event,
+                                              seeded))
+        # Rises and sets alternate; otherwise a seeded search missed one
+        merged = sorted([(jd, 'r') for jd in events[swe.CALC_RISE]] +
+                        [(jd, 's') for jd in events[swe.CALC_SET]])
+        if all(a[1] != b[1] for a, b in zip(merged, merged[1:])):
+            break
+
+    days = [[i, None, None] for i in range(int(round(end - start)))]
+    for field, event in [(1, swe.CALC_RISE), (2, swe.CALC_SET)]:
+        for jd in events[event]:
+            day = days[int(floor(jd - start_ut))]
+            if day[field] is None:
+                day[field] = jd + tz / 24
+    return [MoonDay(start + i, rise, sset) for i, rise, sset in days]
+
 # Tithi doesn't depend on Ayanamsa
 
 
@@ -260,18 +544,28 @@ def tithi(jd, place):
     tz = place.timezone
     # 1. Find time of sunrise
     rise = sunrise(jd, place)[0] - tz / 24
+    moon, sun = _samples(rise)
+    return _tithi(jd, tz, rise, moon, sun)
+
+
+def _samples(rise):
+    """Lunar and solar longitudes at intervals of 0.25 days from sunrise"""
+    moon = [lunar_longitude(rise + t) for t in _sample_offsets]
+    sun = [solar_longitude(rise + t) for t in _sample_offsets]
+    return moon, sun
+
 
+def _tithi(jd, tz, rise, moon, sun):
+    """Tithi and its end time(s) from longitudes sampled at `_sample_offsets`"""
     # 2. Find tithi at this JDN
-    moon_phase = lunar_phase(rise)
+    moon_phase = (moon[0] - sun[0]) % 360
     today = ceil(moon_phase / 12)
     degrees_left = today * 12 - moon_phase
 
     # 3. Compute longitudinal differences at intervals of 0.25 days from sunrise
-    offsets = [0.25, 0.5, 0.75, 1.0]
-    lunar_long_diff = [(lunar_longitude(rise + t) -
-                        lunar_longitude(rise)) % 360 for t in offsets]
-    solar_long_diff = [(solar_longitude(rise + t) -
-                        solar_longitude(rise)) % 360 for t in offsets]
+    offsets = _sample_offsets[1:]
+    lunar_long_diff = [(m - moon[0]) % 360 for m in moon[1:]]
+    solar_long_diff = [(s - sun[0]) % 360 for s in sun[1:]]
     relative_motion = [
         moon - sun for (moon, sun) in zip(lunar_long_diff, solar_long_diff)]
 
@@ -284,7 +578,7 @@ def tithi(jd, place):
     answer = [int(today), to_dms(ends)]
 
     # 5. Check for skipped tithi
-    moon_phase_tmrw = lunar_phase(rise + 1)
+    moon_phase_tmrw = (moon[-1] - sun[-1]) % 360
     tomorrow = ceil(moon_phase_tmrw / 12)
     isSkipped = (tomorrow - today) % 30 > 1
     if isSkipped:
@@ -292,7 +586,7 @@ def tithi(jd, place):
         leap_tithi = today + 1
         degrees_left = leap_tithi * 12 - moon_phase
         approx_end = inverse_lagrange(x, y, degrees_left)
-        ends = (rise + approx_end - jd) * 24 + place.timezone
+        ends = (rise + approx_end - jd) * 24 + tz
         leap_tithi = 1 if today == 30 else leap_tithi
         answer += [int(leap_tithi), to_dms(ends)]
 
@@ -307,8 +601,14 @@ def nakshatra(jd, place):
     lat, lon, tz = place
     rise = sunrise(jd, place)[0] - tz / 24.  # Sunrise at UT 00:00
 
-    offsets = [0.0, 0.25, 0.5, 0.75, 1.0]
-    longitudes = [lunar_longitude(rise + t) for t in offsets]
+    longitudes = [lunar_longitude(rise + t) for t in _sample_offsets]
+    return _nakshatra(jd, tz, rise, longitudes)
+
+
+def _nakshatra(jd, tz, rise, longitudes):
+    """Nakshatra and its end time(s) from lunar longitudes sampled at `_sample_offsets`"""
+    offsets = _sample_offsets
+    longitudes = list(longitudes)  # unwrap_angles() modifies its input
 
     # 2. Today's nakshatra is when offset = 0
     # There are 27 Nakshatras spanning 360 degrees
@@ -341,11 +641,14 @@ def yoga(jd, place):
     # 1. Find time of sunrise
     lat, lon, tz = place
     rise = sunrise(jd, place)[0] - tz / 24.  # Sunrise at UT 00:00
+    moon, sun = _samples(rise)
+    return _yoga(jd, tz, rise, moon, sun)
+
 
+def _yoga(jd, tz, rise, moon, sun):
+    """Yoga and its end time(s) from longitudes sampled at `_sample_offsets`"""
     # 2. Find the Nirayana longitudes and add them
-    lunar_long = lunar_longitude(rise)
-    solar_long = solar_longitude(rise)
-    total = (lunar_long + solar_long) % 360
+    total = (moon[0] + sun[0]) % 360
     # There are 27 Yogas spanning 360 degrees
     yog = ceil(total * 27 / 360)
 
@@ -353,11 +656,9 @@ def yoga(jd, place):
     degrees_left = yog * (360 / 27) - total
 
     # 3. Compute longitudinal sums at intervals of 0.25 days from sunrise
-    offsets = [0.25, 0.5, 0.75, 1.0]
-    lunar_long_diff = [(lunar_longitude(rise + t) -
-                        lunar_longitude(rise)) % 360 for t in offsets]
-    solar_long_diff = [(solar_longitude(rise + t) -
-                        solar_longitude(rise)) % 360 for t in offsets]
+    offsets = _sample_offsets[1:]
+    lunar_long_diff = [(m - moon[0]) % 360 for m in moon[1:]]
+    solar_long_diff = [(s - sun[0]) % 360 for s in sun[1:]]
     total_motion = [moon + sun for (moon, sun)
                     in zip(lunar_long_diff, solar_long_diff)]
 
@@ -370,9 +671,7 @@ def yoga(jd, place):
     answer = [int(yog), to_dms(ends)]
 
     # 5. Check for skipped yoga
-    lunar_long_tmrw = lunar_longitude(rise + 1)
-    solar_long_tmrw = solar_longitude(rise + 1)
-    total_tmrw = (lunar_long_tmrw + solar_long_tmrw) % 360
+    total_tmrw = (moon[-1] + sun[-1]) % 360
     tomorrow = ceil(total_tmrw * 27 / 360)
     isSkipped = (tomorrow - yog) % 27 > 1
     if isSkipped:
@@ -390,15 +689,15 @@ def yoga(jd, place):
 def karana(jd, place):
     """Returns the karana and their ending times. (from 1 to 60)"""
     # 1. Find time of sunrise
-    rise = sunrise(jd, place)[0]
+    rise = sunrise(jd, place)[0] - place.timezone / 24.
 
     # 2. Find karana at this JDN
-    solar_long = solar_longitude(rise)
-    lunar_long = lunar_longitude(rise)
-    moon_phase = (lunar_long - solar_long) % 360
-    today = ceil(moon_phase / 6)
-    degrees_left = today * 6 - moon_phase
+    return _karana(lunar_phase(rise))
+
 
+def _karana(moon_phase):
+    """Karana (1..60) in which the given lunar phase falls"""
+    today = ceil(moon_phase / 6)
     return [int(today)]
 
 
@@ -410,8 +709,34 @@ def vaara(jd):
 def masa(jd, place):
     """Returns lunar month and if it is adhika or not.
        1 = Chaitra, 2 = Vaisakha, ..., 12 = Phalguna"""
+    tz = place.timezone
+    rise = sunrise(jd, place)[0] - tz / 24.
+    if _lunation_table is not None:  # no need of tithi
+        return _lunation_table.lunation(rise).masa
     ti = tithi(jd, place)[0]
-    critical = sunrise(jd, place)[0]  # - tz/24 ?
+    return _lunation(rise, tz, ti).masa
+
+
+# The lunar month (from one new moon to the next) in which a day falls
+Lunation = struct('Lunation', ['last_new_moon', 'next_new_moon', 'masa'])
+
+
+# Precomputed new moons and sankrantis, see lunations.py
+_lunation_table = None
+
+
+def use_lunation_table(table):
+    """Look up lunations in `table` (a lunations.LunationTable) instead of
+       searching for new moons each time. None goes back to searching."""
+    global _lunation_table
+    _lunation_table = table
+
+
+def _lunation(rise, tz, ti):
+    """Lunation in which sunrise `rise` (UT) falls, given the tithi `ti` then"""
+    if _lunation_table is not None:
+        return _lunation_table.lunation(rise)
+    critical = rise + tz / 24.  # - tz/24 ?
     last_new_moon = new_moon(critical, ti, -1)
     next_new_moon = new_moon(critical, ti, +1)
     this_solar_month = raasi(last_new_moon)
@@ -420,7 +745,7 @@ def masa(jd, place):
     maasa = this_solar_month + 1
     if maasa > 12:
         maasa = (maasa % 12)
-    return [int(maasa), is_leap_month]
+    return Lunation(last_new_moon, next_new_moon, [int(maasa), is_leap_month])
 
 
 # epoch-midnight to given midnight
@@ -448,17 +773,64 @@ def new_moon(jd, tithi_, opt=-1):
         start = jd - tithi_         # previous new moon
     if opt == +1:
         start = jd + (30 - tithi_)  # next new moon
-    # Search within a span of (start +- 2) days
-    x = [-2 + offset/4 for offset in range(17)]
-    y = [lunar_phase(start + i) for i in x]
-    y = unwrap_angles(y)
-    y0 = inverse_lagrange(x, y, 360)
-    return start + y0
+    return find_angle(start, 'lunar_phase', 0).jd
+
+
+# ----- End time solver ------
+# Newton's method on the angle that defines an anga, using the daily motions
+# returned along with the longitudes. It converges in two or three steps.
+
+EndTime = struct('EndTime', ['jd', 'calls'])  # calls = ephemeris calls made
+
+_anga_spans = {'tithi': 12, 'karana': 6, 'nakshatra': 360 / 27,
+               'yoga': 360 / 27}
+_end_tolerance = 1 / 86400.  # one second
+
+
+def _angle_motion(jd, anga):
+    """Angle (degrees) which defines `anga` on jd, its daily motion and the
+       number of ephemeris calls made for them"""
+    if anga == 'nakshatra':
+        return sidereal_motion(jd, swe.MOON) + (1,)
+    if anga == 'sun':  # sankrantis
+        return sidereal_motion(jd, swe.SUN) + (1,)
+    sun, sun_speed = sidereal_motion(jd, swe.SUN)
+    moon, moon_speed = sidereal_motion(jd, swe.MOON)
+    if anga == 'yoga':
+        return (moon + sun) % 360, moon_speed + sun_speed, 2
+    # tithi, karana and lunar_phase
+    return (moon - sun) % 360, moon_speed - sun_speed, 2
+
+
+def _newton(jd, anga, target, angle, rate, calls, tolerance):
+    for i in range(20):
+        step = norm180((target - angle) % 360) / rate
+        jd += step
+        if abs(step) < tolerance:
+            break
+        angle, rate, n = _angle_motion(jd, anga)
+        calls += n
+    return EndTime(jd, calls)
+
+
+def find_angle(jd, anga, target, tolerance=_end_tolerance):
+    """Instant (JD, UT) nearest to jd when the angle of `anga` (see
+       _angle_motion) reaches `target` degrees"""
+    angle, rate, calls = _angle_motion(jd, anga)
+    return _newton(jd, anga, target, angle, rate, calls, tolerance)
+
+
+def anga_end(jd, anga, tolerance=_end_tolerance):
+    """End time (JD, UT) of the tithi, nakshatra, yoga or karana running at
+       jd (UT), to within `tolerance` days"""
+    angle, rate, calls = _angle_motion(jd, anga)
+    span = _anga_spans[anga]
+    target = (floor(angle / span) + 1) * span
+    return _newton(jd, anga, target, angle, rate, calls, tolerance)
 
 
 def raasi(jd):
     """Zodiac of given jd. 1 = Mesha, ... 12 = Meena"""
-    s = solar_longitude(jd)
     solar_nirayana = solar_longitude(jd)
     # 12 rasis occupy 360 degrees, so each one is 30 degrees
     return ceil(solar_nirayana / 30.)
@@ -486,138 +858,309 @@ def ritu(masa_num):
     return (masa_num - 1) // 2
 
 
-def day_duration(jd, place):
-    srise = sunrise(jd, place)[0]  # julian day num
-    sset = sunset(jd, place)[0]    # julian day num
-    diff = (sset - srise) * 24     # In hours
+def day_duration(jd, place, day=None):
+    """Day duration in hours; `day` is the SolarDay of jd, if available"""
+    diff = (day or SolarDay(jd, place)).day_duration  # In hours
     return [diff, to_dms(diff)]
 
-# The day duration is divided into 8 parts
-# Similarly night duration
 
+Daily = struct('Daily', ['jd', 'sunrise', 'sunset', 'next_sunrise',
+                         'day_duration', 'tithi', 'nakshatra', 'yoga',
+                         'karana', 'vaara', 'masa', 'ritu', 'samvatsara',
+                         'ahargana', 'kali', 'saka'])
 
-def gauri_chogadiya(jd, place):
-    lat, lon, tz = place
-    tz = place.timezone
-    srise = swe.rise_trans(jd - tz/24, swe.SUN, lon, lat,
-                           rsmi=_rise_flags + swe.CALC_RISE)[1][0]
-    sset = swe.rise_trans(jd - tz/24, swe.SUN, lon, lat,
-                          rsmi=_rise_flags + swe.CALC_SET)[1][0]
-    day_dur = (sset - srise)
-
-    end_times = []
-    for i in range(1, 9):
-        end_times.append(to_dms((srise + (i * day_dur) / 8 - jd) * 24 + tz))
 
-    # Night duration = time from today's sunset to tomorrow's sunrise
-    srise = swe.rise_trans((jd + 1) - tz/24, swe.SUN, lon,
-                           lat, rsmi=_rise_flags + swe.CALC_RISE)[1][0]
-    night_dur = (srise - sset)
-    for i in range(1, 9):
-        end_times.append(to_dms((sset + (i * night_dur) / 8 - jd) * 24 + tz))
+def daily(jd, place):
+    """All the angas of the day at given place in one go.
 
-    return end_times
+       Sunrise, sunset and next sunrise are computed once, and the sun and
+       moon are sampled only once (at `_sample_offsets` from sunrise); every
+       anga is derived from those. Each field has the same form as the value
+       returned by the function of the same name.
+    """
+    rise = _sun_event(jd, place, swe.CALC_RISE)
+    return _daily(jd, place, rise)[0]
 
 
-def trikalam(jd, place, option='rahu'):
-    lat, lon, tz = place
+def _daily(jd, place, rise, lunation=None):
+    """daily() for given sunrise (UT). Also returns next sunrise (UT) and the
+       Lunation, which are reused as is by the following day if it falls in
+       the same lunation."""
     tz = place.timezone
-    srise = swe.rise_trans(jd - tz/24, swe.SUN, lon, lat,
-                           rsmi=_rise_flags + swe.CALC_RISE)[1][0]
-    sset = swe.rise_trans(jd - tz/24, swe.SUN, lon, lat,
-                          rsmi=_rise_flags + swe.CALC_SET)[1][0]
-    day_dur = (sset - srise)
-    weekday = vaara(jd)
-
-    # value in each array is for given weekday (0 = sunday, etc.)
-    offsets = {'rahu': [0.875, 0.125, 0.75, 0.5, 0.625, 0.375, 0.25],
-               'gulika': [0.75, 0.625, 0.5, 0.375, 0.25, 0.125, 0.0],
-               'yamaganda': [0.5, 0.375, 0.25, 0.125, 0.0, 0.75, 0.625]}
-
-    start_time = srise + day_dur * offsets[option][weekday]
-    end_time = start_time + 0.125 * day_dur
-
-    # to local timezone
-    start_time = (start_time - jd) * 24 + tz
-    end_time = (end_time - jd) * 24 + tz
-    return [to_dms(start_time), to_dms(end_time)]  # decimal hours to H:M:S
-
-
-def rahu_kalam(jd, place): return trikalam(jd, place, 'rahu')
-
-
-def yamaganda_kalam(jd, place): return trikalam(jd, place, 'yamaganda')
-
-
-def gulika_kalam(jd, place): return trikalam(jd, place, 'gulika')
-
+    sset = _sun_event(jd, place, swe.CALC_SET)
+    next_rise = _sun_event(jd + 1, place, swe.CALC_RISE)
+    moon, sun = _samples(rise)
+
+    ti = _tithi(jd, tz, rise, moon, sun)
+    nak = _nakshatra(jd, tz, rise, moon)
+    yog = _yoga(jd, tz, rise, moon, sun)
+    kar = _karana((moon[0] - sun[0]) % 360)
+    if lunation is None or not (lunation.last_new_moon <= rise <
+                                lunation.next_new_moon):
+        lunation = _lunation(rise, tz, ti[0])
+    mas = lunation.masa
+    kali, saka = elapsed_year(jd, mas[0])
+    duration = (sset - rise) * 24
+
+    local = lambda t: [t + tz/24., to_dms((t - jd) * 24 + tz)]
+    day = Daily(jd=jd, sunrise=local(rise), sunset=local(sset),
+                next_sunrise=local(next_rise),
+                day_duration=[duration, to_dms(duration)],
+                tithi=ti, nakshatra=nak, yoga=yog, karana=kar,
+                vaara=vaara(jd), masa=mas, ritu=ritu(mas[0]),
+                samvatsara=samvatsara(jd, mas[0]), ahargana=ahargana(jd),
+                kali=kali, saka=saka)
+    return day, next_rise, lunation
+
+
+def calendar(start, end, place, offsets=None):
+    """Generates daily() for each day from Julian day `start` up to, but not
+       including, `end` at given place.
+
+       Each day's next sunrise is the following day's sunrise, and the new
+       moons (hence masa) are found only once per lunation. Only these carry
+       over from one day to the next, so memory use does not grow with the
+       length of the range.
+
+       `offsets`, if given, are the UTC offsets (hours) of each day, used
+       instead of place.timezone; see tzoffsets.py for DST regions. There
+       must be one per day, else ValueError.
+    """
+    if offsets is None:
+        places = repeat(place)
+    else:
+        offsets = list(offsets)
+        days = max(0, int(ceil(end - start)))
+        if len(offsets) != days:
+            raise ValueError("%d offsets for %d days" % (len(offsets), days))
+        places = (Place(place.latitude, place.longitude, tz)
+                  for tz in offsets)
+    jd = start
+    rise = lunation = None
+    for day_place in places:
+        if jd >= end:
+            break
+        if rise is None:
+            rise = _sun_event(start, day_place, swe.CALC_RISE)
+        day, rise, lunation = _daily(jd, day_place, rise, lunation)
+        yield day
+        jd += 1
+
+
+class SolarDay(object):
+    """Sunrise, sunset and next sunrise of given date and place, each computed
+       once (on first use), and all divisions of the day and night derived
+       from them. Times are JD (UT); the derived timings are local hours,
+       as returned by the functions of the same name."""
+
+    def __init__(self, jd, place, sunrise=None, sunset=None,
+                 next_sunrise=None):
+        self.jd = jd
+        self.place = place
+        # Any of these (JD, UT) may be given if already known
+        self._sunrise = sunrise
+        self._sunset = sunset
+        self._next_sunrise = next_sunrise
+
+    @property
+    def sunrise(self):
+        if self._sunrise is None:
+            self._sunrise = _sun_event(self.jd, self.place, swe.CALC_RISE)
+        return self._sunrise
+
+    @property
+    def sunset(self):
+        if self._sunset is None:
+            self._sunset = _sun_event(self.jd, self.place, swe.CALC_SET)
+        return self._sunset
+
+    @property
+    def next_sunrise(self):
+        if self._next_sunrise is None:
+            self._next_sunrise = _sun_event(self.jd + 1, self.place,
+                                            swe.CALC_RISE)
+        return self._next_sunrise
+
+    @property
+    def day_duration(self): return (self.sunset - self.sunrise) * 24
+
+    @property
+    def night_duration(self): return (self.next_sunrise - self.sunset) * 24
+
+    def following(self):
+        """SolarDay of the next date, its sunrise being this next_sunrise"""
+        return SolarDay(self.jd + 1, self.place, self.next_sunrise)
+
+    def local(self, jd):
+        """JD (UT) to local time in decimal hours since midnight"""
+        return (jd - self.jd) * 24 + self.place.timezone
+
+    # The day duration is divided into 8 parts
+    # Similarly night duration
+    @property
+    def gauri_chogadiya(self):
+        srise, sset = self.sunrise, self.sunset
+        day_dur = (sset - srise)
+
+        end_times = []
+        for i in range(1, 9):
+            end_times.append(to_dms(self.local(srise + (i * day_dur) / 8)))
+
+        # Night duration = time from today's sunset to tomorrow's sunrise
+        night_dur = (self.next_sunrise - sset)
+        for i in range(1, 9):
+            end_times.append(to_dms(self.local(sset + (i * night_dur) / 8)))
+
+        return end_times
+
+    def trikalam_period(self, option='rahu'):
+        """Start and end (JD, UT) of rahu, yamaganda or gulika kalam"""
+        srise = self.sunrise
+        day_dur = (self.sunset - srise)
+        weekday = vaara(self.jd)
+
+        # value in each array is for given weekday (0 = sunday, etc.)
+        offsets = {'rahu': [0.875, 0.125, 0.75, 0.5, 0.625, 0.375, 0.25],
+                   'gulika': [0.75, 0.625, 0.5, 0.375, 0.25, 0.125, 0.0],
+                   'yamaganda': [0.5, 0.375, 0.25, 0.125, 0.0, 0.75, 0.625]}
+
+        start_time = srise + day_dur * offsets[option][weekday]
+        end_time = start_time + 0.125 * day_dur
+        return start_time, end_time
+
+    def trikalam(self, option='rahu'):
+        start_time, end_time = self.trikalam_period(option)
+        # to local timezone, decimal hours to H:M:S
+        return [to_dms(self.local(start_time)), to_dms(self.local(end_time))]
+
+    @property
+    def rahu_kalam(self): return self.trikalam('rahu')
+
+    @property
+    def yamaganda_kalam(self): return self.trikalam('yamaganda')
+
+    @property
+    def gulika_kalam(self): return self.trikalam('gulika')
+
+    @property
+    def durmuhurtam(self):
+        periods = self.durmuhurtam_periods
+        # convert to local time; 0 where there is no second durmuhurtam
+        start_times = [self.local(start) for start, end in periods] + [0]
+        end_times = [self.local(end) for start, end in periods] + [0]
+        return [start_times[:2], end_times[:2]]  # in decimal hours
+
+    @property
+    def durmuhurtam_periods(self):
+        """Start and end (JD, UT) of each durmuhurtam of the day"""
+        # Night = today's sunset to tomorrow's sunrise
+        sset = self.sunset
+        weekday = vaara(self.jd)
+        # Day = today's sunrise to today's sunset
+        srise = self.sunrise
+        day_dur = (sset - srise)
+
+        # There is one durmuhurtam on Sun, Wed, Sat; the rest have two
+        offsets = [[10.4, 0.0],  # Sunday
+                   [6.4, 8.8],   # Monday
+                   [2.4, 4.8],   # Tuesday, [day_duration , night_duration]
+                   [5.6, 0.0],   # Wednesday
+                   [4.0, 8.8],   # Thursday
+                   [2.4, 6.4],   # Friday
+                   [1.6, 0.0]]   # Saturday
+
+        # second durmuhurtam of tuesday uses night_duration instead of day_duration
+        dur = [day_dur, day_dur]
+        base = [srise, srise]
+        if weekday == 2:
+            dur[1] = (self.next_sunrise - sset)
+            base[1] = sset
+
+        # compute start and end timings
+        periods = []
+        for i in range(0, 2):
+            offset = offsets[weekday][i]
+            if offset != 0.0:
+                start_time = base[i] + dur[i] * offsets[weekday][i] / 12
+                periods.append((start_time, start_time + day_dur * 0.8 / 12))
+        return periods
+
+    @property
+    def abhijit_muhurta(self):
+        """Abhijit muhurta is the 8th muhurta (middle one) of the 15 muhurtas
+        during the day_duration (~12 hours)"""
+        start_time, end_time = self.abhijit_period
+        # to local time
+        return [self.local(start_time), self.local(end_time)]
+
+    @property
+    def abhijit_period(self):
+        """Start and end (JD, UT) of abhijit muhurta"""
+        srise = self.sunrise
+        day_dur = (self.sunset - srise)
+        return srise + 7 / 15 * day_dur, srise + 8 / 15 * day_dur
+
+    @property
+    def muhurtas(self):
+        """End times of the 15 muhurtas of the day, then the 15 of the night"""
+        srise, sset = self.sunrise, self.sunset
+        day_dur = (sset - srise)
+        night_dur = (self.next_sunrise - sset)
+        return [to_dms(self.local(srise + i * day_dur / 15))
+                for i in range(1, 16)] + \
+               [to_dms(self.local(sset + i * night_dur / 15))
+                for i in range(1, 16)]
+
+    @property
+    def horas(self):
+        """[lord, end time] of the 12 horas of the day, then the 12 of the
+        night. The first hora of the day belongs to the lord of the weekday"""
+        srise, sset = self.sunrise, self.sunset
+        day_dur = (sset - srise)
+        night_dur = (self.next_sunrise - sset)
+        first = _hora_lords.index(_vaara_lords[vaara(self.jd)])
+        ends = [srise + i * day_dur / 12 for i in range(1, 13)] + \
+               [sset + i * night_dur / 12 for i in range(1, 13)]
+        return [[_hora_lords[(first + i) % 7], to_dms(self.local(end))]
+                for i, end in enumerate(ends)]
+
+
+# Lords of the weekdays (0 = Sunday) and the (Chaldean) order of the horas
+_vaara_lords = [swe.SUN, swe.MOON, swe.MARS, swe.MERCURY, swe.JUPITER,
+                swe.VENUS, swe.SATURN]
+_hora_lords = [swe.SATURN, swe.JUPITER, swe.MARS, swe.SUN, swe.VENUS,
+               swe.MERCURY, swe.MOON]
+
+
+# Each of these accepts the SolarDay of (jd, place) as `day`, if available
+
+
+def gauri_chogadiya(jd, place, day=None):
+    return (day or SolarDay(jd, place)).gauri_chogadiya
+
+
+def trikalam(jd, place, option='rahu', day=None):
+    return (day or SolarDay(jd, place)).trikalam(option)
+
+
+def rahu_kalam(jd, place, day=None): return trikalam(jd, place, 'rahu', day)
+
+
+def yamaganda_kalam(jd, place, day=None):
+    return trikalam(jd, place, 'yamaganda', day)
+
+
+def gulika_kalam(jd, place, day=None): return trikalam(jd, place, 'gulika', day)
+
+
+def durmuhurtam(jd, place, day=None):
+    return (day or SolarDay(jd, place)).durmuhurtam
 
-def durmuhurtam(jd, place):
-    lat, lon, tz = place
-    tz = place.timezone
 
-    # Night = today's sunset to tomorrow's sunrise
-    sset = swe.rise_trans(jd - tz/24, swe.SUN, lon, lat,
-                          rsmi=_rise_flags + swe.CALC_SET)[1][0]
-    srise = swe.rise_trans((jd + 1) - tz/24, swe.SUN, lon,
-                           lat, rsmi=_rise_flags + swe.CALC_RISE)[1][0]
-    night_dur = (srise - sset)
-
-    # Day = today's sunrise to today's sunset
-    srise = swe.rise_trans(jd - tz/24, swe.SUN, lon, lat,
-                           rsmi=_rise_flags + swe.CALC_RISE)[1][0]
-    day_dur = (sset - srise)
-
-    weekday = vaara(jd)
-
-    # There is one durmuhurtam on Sun, Wed, Sat; the rest have two
-    offsets = [[10.4, 0.0],  # Sunday
-               [6.4, 8.8],   # Monday
-               [2.4, 4.8],   # Tuesday, [day_duration , night_duration]
-               [5.6, 0.0],   # Wednesday
-               [4.0, 8.8],   # Thursday
-               [2.4, 6.4],   # Friday
-               [1.6, 0.0]]   # Saturday
-
-    # second durmuhurtam of tuesday uses night_duration instead of day_duration
-    dur = [day_dur, day_dur]
-    base = [srise, srise]
-    if weekday == 2:
-        dur[1] = night_dur
-        base[1] = sset
-
-    # compute start and end timings
-    start_times = [0, 0]
-    end_times = [0, 0]
-    for i in range(0, 2):
-        offset = offsets[weekday][i]
-        if offset != 0.0:
-            start_times[i] = base[i] + dur[i] * offsets[weekday][i] / 12
-            end_times[i] = start_times[i] + day_dur * 0.8 / 12
-
-            # convert to local time
-            start_times[i] = (start_times[i] - jd) * 24 + tz
-            end_times[i] = (end_times[i] - jd) * 24 + tz
-
-    return [start_times, end_times]  # in decimal hours
-
-
-def abhijit_muhurta(jd, place):
+def abhijit_muhurta(jd, place, day=None):
     """Abhijit muhurta is the 8th muhurta (middle one) of the 15 muhurtas
     during the day_duration (~12 hours)"""
-    lat, lon, tz = place
-    tz = place.timezone
-    srise = swe.rise_trans(jd - tz/24, swe.SUN, lon, lat,
-                           rsmi=_rise_flags + swe.CALC_RISE)[1][0]
-    sset = swe.rise_trans(jd - tz/24, swe.SUN, lon, lat,
-                          rsmi=_rise_flags + swe.CALC_SET)[1][0]
-    day_dur = (sset - srise)
-
-    start_time = srise + 7 / 15 * day_dur
-    end_time = srise + 8 / 15 * day_dur
-
-    # to local time
-    return [(start_time - jd) * 24 + tz, (end_time - jd) * 24 + tz]
+    return (day or SolarDay(jd, place)).abhijit_muhurta
 
 # 'jd' can be any time: ex, 2015-09-19 14:20 UTC
 # today = swe.julday(2015, 9, 19, 14 + 20./60)
@@ -649,21 +1192,36 @@ def planetary_positions(jd, place):
     return positions
 
 
+def sidereal_ascendant(jd, lat, lon):
+    """Nirayana longitude of the ascendant at jd (UT) and given location"""
+    if _lagna_engine is not None:
+        lagna = _lagna_engine.lagna(jd, lat, lon)
+        if lagna is not None:
+            return lagna
+    # returns two arrays, cusps and ascmc, where ascmc[0] = Ascendant
+    return swe.houses_ex(jd, lat, lon, flag=swe.FLG_SIDEREAL)[1][0]
+
+
+_lagna_engine = None
+
+
+def use_lagna_engine(engine):
+    """Take the ascendant from `engine`, e.g. a lagna.LagnaEngine, wherever
+       its lagna() does not return None. None goes back to houses_ex()."""
+    global _lagna_engine
+    _lagna_engine = engine
+
+
 def ascendant(jd, place):
     """Lagna (=ascendant) calculation at any given time & place"""
     lat, lon, tz = place
     jd_utc = jd - (tz / 24.)
-    set_ayanamsa_mode()  # needed for swe.houses_ex()
 
-    # returns two arrays, cusps and ascmc, where ascmc[0] = Ascendant
-    nirayana_lagna = swe.houses_ex(
-        jd_utc, lat, lon, flag=swe.FLG_SIDEREAL)[1][0]
+    nirayana_lagna = sidereal_ascendant(jd_utc, lat, lon)
     # 12 zodiac signs span 360°, so each one takes 30°
     # 0 = Mesha, 1 = Vrishabha, ..., 11 = Meena
     constellation = int(nirayana_lagna / 30)
     coordinates = to_dms(nirayana_lagna % 30)
-
-    reset_ayanamsa_mode()
     return [constellation, coordinates, nakshatra_pada(nirayana_lagna)]
 
 # http://www.oocities.org/talk2astrologer/LearnAstrology/Details/Navamsa.html
@@ -772,6 +1330,145 @@ def masa_tests():
     print(masa(may21, helsinki))   # Jyestha [3]
 
 
+def daily_tests():
+    print(sys._getframe().f_code.co_name)
+    for jd, place in [(date1, bangalore), (date2, helsinki), (date4, shillong)]:
+        day = daily(jd, place)
+        assert(day.tithi == tithi(jd, place))
+        assert(day.nakshatra == nakshatra(jd, place))
+        assert(day.yoga == yoga(jd, place))
+        assert(day.karana == karana(jd, place))
+        assert(day.masa == masa(jd, place))
+        assert(day.sunrise == sunrise(jd, place))
+        assert(day.sunset == sunset(jd, place))
+        assert(day.day_duration == day_duration(jd, place))
+
+
+def cache_tests():
+    print(sys._getframe().f_code.co_name)
+    jd = swe.julday(2015, 9, 25, 13 + 29/60. + 13/3600.)
+    expected = navamsa(jd, bangalore)
+    enable_longitude_cache(maxsize=16)
+    planetary_positions(jd, bangalore)
+    assert(navamsa(jd, bangalore) == expected)
+    info = longitude_cache_info()
+    # Rahu and Ketu share MEAN_NODE; navamsa() is served entirely from cache
+    assert(info.misses == 10 and info.hits == 12 and info.currsize == 10)
+    enable_longitude_cache(maxsize=4)
+    assert(longitude_cache_info().evictions == 6)
+    clear_longitude_cache()
+    assert(longitude_cache_info().currsize == 0)
+    disable_longitude_cache()
+    assert(longitude_cache_info() is None)
+
+
+def ayanamsa_tests():
+    print(sys._getframe().f_code.co_name)
+    jd = swe.julday(2015, 9, 25, 13 + 29/60. + 13/3600.)
+    sidereal = [sidereal_longitude(jd, planet) for planet in planet_list]
+    with ayanamsa_session(tropical=True):
+        tropical = [sidereal_longitude(jd, planet) for planet in planet_list]
+    assert(all(abs(norm180(a - b)) < 1e-6 for a, b in zip(sidereal, tropical)))
+    with ayanamsa_session(swe.SIDM_RAMAN):
+        assert(get_ayanamsa_mode().mode == swe.SIDM_RAMAN)
+        assert(abs(sidereal_longitude(jd, swe.SUN) - sidereal[0]) > 1)
+    assert(get_ayanamsa_mode() == (swe.SIDM_LAHIRI, 0, 0, False))
+    # Root-finding the ayanamsa leaves the one in effect as it was, also
+    # when it fails (e.g. without the star catalogue sefstars.txt)
+    try:
+        function(jd)
+    except swe.Error:
+        pass
+    assert(get_ayanamsa_mode() == (swe.SIDM_LAHIRI, 0, 0, False))
+    assert(sidereal_longitude(jd, swe.SUN) == sidereal[0])
+    revati_359_50()
+    assert(get_ayanamsa_mode().mode == swe.SIDM_USER)
+    reset_ayanamsa_mode()
+    assert(get_ayanamsa_mode() == (swe.SIDM_LAHIRI, 0, 0, False))
+
+
+def calendar_tests():
+    print(sys._getframe().f_code.co_name)
+    start = gregorian_to_jd(Date(2012, 7, 1))
+    days = list(calendar(start, start + 100, bangalore))
+    assert(len(days) == 100)
+    for day in days:
+        assert(day == daily(day.jd, bangalore))
+    # Adhika Bhadrapada followed by the normal one
+    assert([6, True] in [day.masa for day in days])
+    assert([6, False] in [day.masa for day in days])
+    # Summer time in Helsinki began on 25th March 2012
+    start = gregorian_to_jd(Date(2012, 3, 20))
+    offsets = [+2.0] * 6 + [+3.0] * 4
+    days = list(calendar(start, start + 10, helsinki, offsets))
+    for day, tz in zip(days, offsets):
+        assert(day == daily(day.jd, Place(helsinki.latitude,
+                                          helsinki.longitude, tz)))
+    try:
+        list(calendar(start, start + 10, helsinki, offsets[:-1]))
+        assert(False)
+    except ValueError:
+        pass
+
+
+def solver_tests():
+    print(sys._getframe().f_code.co_name)
+    for jd, place in [(date1, bangalore), (date2, helsinki), (date4, shillong)]:
+        rise = sunrise(jd, place)[0] - place.timezone / 24.
+        for func, anga in [(tithi, 'tithi'), (nakshatra, 'nakshatra'),
+                           (yoga, 'yoga')]:
+            end = anga_end(rise, anga)
+            ends = (end.jd - jd) * 24 + place.timezone
+            # Within a few seconds of the interpolated end time
+            assert(abs(ends - from_dms(*func(jd, place)[1])) < 5 / 3600.)
+            assert(end.calls <= 8)
+    # Exactly at the boundary
+    phase = lunar_phase(anga_end(date2, 'tithi', tolerance=1e-9).jd)
+    assert(min(phase % 12, 12 - phase % 12) < 1e-6)
+
+
+def solar_day_tests():
+    print(sys._getframe().f_code.co_name)
+    day = SolarDay(date2, bangalore)
+    assert(from_dms(*to_dms(day.local(day.sunrise))) ==
+           from_dms(*sunrise(date2, bangalore)[1]))
+    assert(rahu_kalam(date2, bangalore, day) == day.rahu_kalam)
+    assert(gauri_chogadiya(date2, bangalore) == day.gauri_chogadiya)
+    # 8th muhurta is abhijit; horas and muhurtas tile the whole day
+    assert(day.muhurtas[7] == to_dms(day.abhijit_muhurta[1]))
+    assert(day.horas[-1][1] == day.muhurtas[-1] == day.gauri_chogadiya[-1])
+    assert(day.horas[0][0] == swe.VENUS)  # Friday
+    following = day.following()
+    assert(following.sunrise == day.next_sunrise)
+    assert(following.next_sunrise ==
+           SolarDay(date2 + 2, bangalore).sunrise)
+
+
+def moon_table_tests():
+    print(sys._getframe().f_code.co_name)
+    start = gregorian_to_jd(Date(2013, 1, 1))
+    days = moon_table(start, start + 31, bangalore)
+    assert([day.jd for day in days] == [start + i for i in range(31)])
+    # No moonset on 18th January (moonset() gives 24:08:47)
+    assert(days[17].moonset is None and days[17].moonrise is not None)
+    for place in [bangalore, helsinki]:
+        lat, lon, tz = place
+        days = moon_table(start, start + 366, place)
+        missing = 0
+        for day in days:
+            for event, flag in [(day.moonrise, swe.CALC_RISE),
+                                (day.moonset, swe.CALC_SET)]:
+                # The next event from midnight, as moonrise() finds it
+                expected = swe.rise_trans(day.jd - tz/24, swe.MOON, lon, lat,
+                                          rsmi=_rise_flags + flag)[1][0]
+                if expected + tz/24 >= day.jd + 1:
+                    assert(event is None)
+                    missing += 1
+                else:
+                    assert(abs(event - tz/24 - expected) < 0.1 / 86400)
+        assert(12 <= missing <= 30)  # about one rise and one set a month
+
+
 def ascendant_tests():
     print(sys._getframe().f_code.co_name)
     jd = swe.julday(2015, 9, 24, 23 + 38/60.)
@@ -791,6 +1488,9 @@ def navamsa_tests():
 
 if __name__ == "__main__":
     import sys
+    if sys.argv[1:2] == ['batch']:  # python -m panchanga batch ...
+        import batch
+        sys.exit(batch.main(sys.argv[2:]))
     bangalore = Place(12.972, 77.594, +5.5)
     shillong = Place(25.569, 91.883, +5.5)
     helsinki = Place(60.17, 24.935, +2.0)
@@ -805,6 +1505,13 @@ if __name__ == "__main__":
     nakshatra_tests()
     yoga_tests()
     masa_tests()
+    daily_tests()
+    calendar_tests()
+    solver_tests()
+    solar_day_tests()
+    moon_table_tests()
+    cache_tests()
+    ayanamsa_tests()
     ascendant_tests()
     navamsa_tests()
     # new_moon(jd)
@@ -0,0 +1,372 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# service.py -- panchanga as a JSON web service
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+A small HTTP/JSON server (asyncio, standard library only):
+
+    python service.py --port 8080 --workers 2
+
+    GET /daily?date=2013-01-18&lat=12.972&lon=77.594&tz=5.5
+    GET /kalams?...             rahu, yamaganda, gulika kalam, durmuhurtam,
+                                abhijit muhurta, gauri chogadiya
+    GET /positions?...&time=13:29:13    grahas and lagna
+    GET /dasha?...&time=09:40&on=2014-10-20   birth date/time, and the
+                                              periods running `on` a date
+    GET /stats                  cache and worker statistics
+
+All take an optional ayanamsa=lahiri (default), raman, krishnamurti,
+fagan_bradley or tropical. Latitude and longitude are rounded to 3 decimals
+(about 100 m).
+
+The ephemeris work runs in a bounded pool of worker processes. Identical
+requests arriving while one is being computed wait for that computation,
+and results are kept in an LRU cache.
+"""
+
+from __future__ import division
+import sys
+import json
+import asyncio
+import datetime
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+import swisseph as swe
+import panchanga
+import vimsottari
+from panchanga import Date, Place, gregorian_to_jd, ayanamsa_session, \
+    daily, SolarDay, planet_list, get_planet_name
+from chart import Chart
+
+ayanamsas = {
+    'lahiri': (swe.SIDM_LAHIRI, False),
+    'raman': (swe.SIDM_RAMAN, False),
+    'krishnamurti': (swe.SIDM_KRISHNAMURTI, False),
+    'fagan_bradley': (swe.SIDM_FAGAN_BRADLEY, False),
+    'tropical': (swe.SIDM_LAHIRI, True),
+}
+
+
+class RequestError(ValueError):
+    pass
+
+
+def _date(text):
+    try:
+        year, month, day = [int(x) for x in text.split('-')]
+        datetime.date(year, month, day)
+    except ValueError:
+        raise RequestError("date must be YYYY-MM-DD: %r" % text)
+    return gregorian_to_jd(Date(year, month, day))
+
+
+def _hours(text):
+    try:
+        parts = [float(x) for x in text.split(':')]
+    except ValueError:
+        raise RequestError("time must be HH:MM[:SS]: %r" % text)
+    return sum(part / 60 ** i for i, part in enumerate(parts))
+
+
+def parse(endpoint, params):
+    """Cache key of a request: (endpoint, jd, place, ayanamsa, extra)"""
+    if endpoint not in endpoints:
+        raise RequestError("no such endpoint: %s" % endpoint)
+    try:
+        place = Place(round(float(params['lat']), 3),
+                      round(float(params['lon']), 3), float(params['tz']))
+    except KeyError as e:
+        raise RequestError("missing parameter: %s" % e.args[0])
+    except ValueError:
+        raise RequestError("lat, lon and tz must be numbers")
+    jd = _date(params.get('date', ''))
+    ayanamsa = params.get('ayanamsa', 'lahiri')
+    if ayanamsa not in ayanamsas:
+        raise RequestError("unknown ayanamsa: %s" % ayanamsa)
+    extra = ()
+    if endpoint in ('positions', 'dasha'):
+        extra = (_hours(params.get('time', '0:00')),)
+    if endpoint == 'dasha' and 'on' in params:
+        extra += (_date(params['on']),)
+    return endpoint, jd, place, ayanamsa, extra
+
+
+def _daily(jd, place):
+    return daily(jd, place)._asdict()
+
+
+def _kalams(jd, place):
+    day = SolarDay(jd, place)
+    return {'rahu_kalam': day.rahu_kalam,
+            'yamaganda_kalam': day.yamaganda_kalam,
+            'gulika_kalam': day.gulika_kalam,
+            'durmuhurtam': day.durmuhurtam,
+            'abhijit_muhurta': day.abhijit_muhurta,
+            'gauri_chogadiya': day.gauri_chogadiya}
+
+
+def _positions(jd, place, hours):
+    chart = Chart(jd + hours / 24, place)
+    return {'positions': chart.positions(),
+            'retrograde': chart.retrograde,
+            'ascendant': chart.ascendant(),
+            'navamsa': chart.navamsa()}
+
+
+def _dasha(jd, place, hours, on=None):
+    birth = jd + (hours - place.timezone) / 24  # UT
+    tree = vimsottari.DashaTree.from_birth(birth)
+    name = get_planet_name
+    result = {'mahadasa': [[name(lord), start] for lord, start in
+                           vimsottari.vimsottari_mahadasa(birth).items()]}
+    if on is not None:
+        result['current'] = [['/'.join(name(lord) for lord in period.lords),
+                              period.start, period.end]
+                             for period in tree.at(on - place.timezone / 24)]
+    return result
+
+
+endpoints = {'daily': _daily, 'kalams': _kalams, 'positions': _positions,
+             'dasha': _dasha}
+
+
+def compute(key):
+    """Result of the request `key` (from parse()); runs in a worker"""
+    endpoint, jd, place, ayanamsa, extra = key
+    mode, tropical = ayanamsas[ayanamsa]
+    with ayanamsa_session(mode, tropical=tropical):
+        return endpoints[endpoint](jd, place, *extra)
+
+
+class PanchangaService(object):
+    """Computes requests in `workers` processes, sharing in-flight
+       computations and caching up to `cache_size` results"""
+
+    def __init__(self, workers=None, cache_size=10000):
+        self.executor = ProcessPoolExecutor(workers)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._pending = {}
+        self.stats = {'requests': 0, 'hits': 0, 'coalesced': 0,
+                      'computed': 0, 'errors': 0}
+
+    async def get(self, endpoint, params):
+        """Result of a request, as a JSON-ready object"""
+        self.stats['requests'] += 1
+        key = parse(endpoint, params)
+        if key in self._cache:
+            self.stats['hits'] += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        if key in self._pending:
+            self.stats['coalesced'] += 1
+            return await asyncio.shield(self._pending[key])
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, compute, key)
+        self._pending[key] = future
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            del self._pending[key]
+        self.stats['computed'] += 1
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    async def respond(self, target):
+        """HTTP status and JSON body for the request target (path?query)"""
+        url = urlsplit(target)
+        endpoint = url.path.strip('/')
+        if endpoint == 'stats':
+            return 200, dict(self.stats, cached=len(self._cache),
+                             in_flight=len(self._pending))
+        try:
+            return 200, await self.get(endpoint, dict(parse_qsl(url.query)))
+        except RequestError as e:
+            self.stats['errors'] += 1
+            return 404 if 'endpoint' in str(e) else 400, {'error': str(e)}
+        except Exception as e:
+            self.stats['errors'] += 1
+            return 500, {'error': '%s: %s' % (type(e).__name__, e)}
+
+    async def handle(self, reader, writer):
+        """One HTTP/1.1 connection, possibly with several requests"""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                method, target, version = line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if method != 'GET':
+                    status, body = 405, {'error': "only GET is supported"}
+                else:
+                    status, body = await self.respond(target)
+                data = json.dumps(body).encode('utf-8')
+                close = headers.get('connection', '').lower() == 'close' or \
+                    version == 'HTTP/1.0'
+                writer.write(('HTTP/1.1 %d %s\r\n'
+                              'Content-Type: application/json\r\n'
+                              'Content-Length: %d\r\n'
+                              '%s\r\n' %
+                              (status, _reasons[status], len(data),
+                               'Connection: close\r\n' if close else '')
+                              ).encode('latin-1') + data)
+                await writer.drain()
+                if close:
+                    break
+        except (ValueError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host='127.0.0.1', port=8080):
+        return await asyncio.start_server(self.handle, host, port)
+
+    def close(self): self.executor.shutdown()
+
+
+_reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+            405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+
+def main(argv):
+    import argparse
+    parser = argparse.ArgumentParser(description="Panchanga JSON service")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=None,
+                        help="worker processes (default: one per CPU)")
+    parser.add_argument('--cache-size', type=int, default=10000)
+    args = parser.parse_args(argv)
+
+    async def run():
+        service = PanchangaService(args.workers, args.cache_size)
+        server = await service.serve(args.host, args.port)
+        print("serving on http://%s:%d/" % (args.host, args.port))
+        try:
+            await server.serve_forever()
+        finally:
+            service.close()
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+
+# ----- TESTS ------
+
+
+def service_tests():
+    import time
+    print(sys._getframe().f_code.co_name)
+    bangalore = {'lat': '12.972', 'lon': '77.594', 'tz': '5.5',
+                 'date': '2013-01-18'}
+    jd = gregorian_to_jd(Date(2013, 1, 18))
+
+    async def fetch(port, target):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        writer.write(('GET %s HTTP/1.1\r\nConnection: close\r\n\r\n' %
+                      target).encode('latin-1'))
+        response = await reader.read()
+        writer.close()
+        head, body = response.split(b'\r\n\r\n', 1)
+        return int(head.split()[1]), json.loads(body.decode('utf-8'))
+
+    async def run():
+        service = PanchangaService(workers=2, cache_size=100)
+        # A burst of identical requests: one computation
+        start = time.time()
+        results = await asyncio.gather(*[service.get('daily', bangalore)
+                                         for i in range(200)])
+        burst = time.time() - start
+        assert(service.stats['computed'] == 1)
+        assert(service.stats['coalesced'] == 199)
+        expected = json.loads(json.dumps(
+            daily(jd, Place(12.972, 77.594, 5.5))._asdict()))
+        assert(json.loads(json.dumps(results[0])) == expected)
+        await service.get('daily', bangalore)
+        assert(service.stats['hits'] == 1)
+        print("200 identical requests: 1 computation, %.3f s" % burst)
+
+        # Nearby coordinates share the cache entry; other ayanamsa does not
+        near = dict(bangalore, lat='12.9721')
+        await service.get('daily', near)
+        assert(service.stats['computed'] == 1)
+        raman = await service.get('daily', dict(bangalore, ayanamsa='raman'))
+        assert(service.stats['computed'] == 2)
+
+        server = await service.serve(port=0)
+        port = server.sockets[0].getsockname()[1]
+        query = '&'.join('%s=%s' % item for item in sorted(bangalore.items()))
+        status, body = await fetch(port, '/kalams?' + query)
+        assert(status == 200 and body['rahu_kalam'] == [list(x) for x in
+               panchanga.rahu_kalam(jd, Place(12.972, 77.594, 5.5))])
+        status, body = await fetch(port, '/positions?time=13:29:13&' + query)
+        assert(status == 200 and len(body['positions']) == len(planet_list))
+        status, body = await fetch(port, '/dasha?time=09:40&on=2014-10-20&'
+                                   + query.replace('2013-01-18', '1985-06-09'))
+        assert(status == 200 and len(body['mahadasa']) == 9)
+        assert(len(body['current']) == 5)
+        status, body = await fetch(port, '/daily?' + query + '&lat=x')
+        assert(status == 400)
+        status, body = await fetch(port, '/daily?' +
+                                   query.replace('2013-01-18', '2013-02-30'))
+        assert(status == 400 and '2013-02-30' in body['error'])
+        status, body = await fetch(port, '/nothing?' + query)
+        assert(status == 404)
+        async def fail(endpoint, params):
+            raise swe.Error("ephemeris file not found")
+        service.get = fail
+        status, body = await fetch(port, '/daily?' + query)
+        assert(status == 500 and body['error'].startswith('Error: '))
+        del service.get
+        status, body = await fetch(port, '/stats')
+        assert(status == 200 and body['errors'] == 4)
+
+        # Many distinct requests in flight, bounded by the worker pool
+        days = ['2014-%02d-%02d' % (m, d) for m in range(1, 13)
+                for d in (1, 11, 21)]
+        start = time.time()
+        await asyncio.gather(*[service.get('daily', dict(bangalore, date=d))
+                               for d in days])
+        elapsed = time.time() - start
+        print("%d distinct requests: %.2f s (%.0f/s)" %
+              (len(days), elapsed, len(days) / elapsed))
+        server.close()
+        await server.wait_closed()
+        service.close()
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ['test']:
+        service_tests()
+    else:
+        main(sys.argv[1:])
@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# transitions.py -- index of the start/end times of tithi, nakshatra, etc.
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Every tithi, nakshatra, yoga and karana boundary in a span of time, found by
+one scan of the sun and moon. Which anga is running at any instant is then a
+binary search, independent of sunrise.
+
+    index = TransitionIndex.build(jd_start, jd_end)
+    index.at('tithi', jd)          # Period(number, start, end), all in UT
+    for period in index.between('nakshatra', jd1, jd2): ...
+"""
+
+from __future__ import division
+from collections import namedtuple as struct
+import numpy as np
+from vectorized import sidereal_longitudes
+import swisseph as swe
+
+# anga: (its angle from sun's and moon's longitudes, span of one, count)
+angas = {
+    'tithi': (lambda sun, moon: moon - sun, 12, 30),
+    'karana': (lambda sun, moon: moon - sun, 6, 60),
+    'nakshatra': (lambda sun, moon: moon, 360 / 27, 27),
+    'yoga': (lambda sun, moon: moon + sun, 360 / 27, 27),
+}
+
+# The longest of these periods lasts just over a day; scanning this many
+# extra days on either side gives the full extent of the periods at the ends
+_margin = 2
+
+Period = struct('Period', ['number', 'start', 'end'])
+
+
+def inverse_lagrange(x, y, ya):
+    """panchanga.inverse_lagrange() of each row of x and y (shape (m, n))"""
+    total = np.zeros(len(ya))
+    n = x.shape[1]
+    for i in range(n):
+        numer = np.ones(len(ya))
+        denom = np.ones(len(ya))
+        for j in range(n):
+            if j != i:
+                numer *= (ya - y[:, j])
+                denom *= (y[:, i] - y[:, j])
+        total += numer * x[:, i] / denom
+    return total
+
+
+def boundaries(jds, angle, span, count):
+    """Instants at which the sampled `angle` (degrees, at `jds`) crosses a
+       multiple of `span`, and the anga (1..count) that begins there"""
+    unwrapped = np.degrees(np.unwrap(np.radians(angle % 360)))
+    first = int(np.floor(unwrapped[0] / span)) + 1
+    last = int(np.floor(unwrapped[-1] / span))
+    k = np.arange(first, last + 1)
+    ya = k * span
+    # 4-point inverse Lagrange on the samples around each crossing
+    i = np.searchsorted(unwrapped, ya)
+    window = np.clip(i, 2, len(jds) - 2)[:, np.newaxis] + np.arange(-2, 2)
+    times = inverse_lagrange(jds[window], unwrapped[window], ya)
+    return times, (k % count + 1).astype(np.int8)
+
+
+class TransitionIndex(object):
+    """Sorted start times (JD, UT) of every period of each anga"""
+
+    def __init__(self, times, numbers):
+        self.times = times      # anga -> float64 array of start times
+        self.numbers = numbers  # anga -> int8 array of the anga then begun
+
+    @classmethod
+    def build(cls, start, end, step=0.25):
+        """Scans from `start` to `end` (JD, UT), sampling every `step` days"""
+        jds = np.arange(start - _margin, end + _margin + step, step)
+        sun, moon = sidereal_longitudes(jds, [swe.SUN, swe.MOON]).T
+        times, numbers = {}, {}
+        for anga, (angle, span, count) in angas.items():
+            times[anga], numbers[anga] = boundaries(jds, angle(sun, moon),
+                                                    span, count)
+        return cls(times, numbers)
+
+    def save(self, path):
+        arrays = {}
+        for anga in self.times:
+            arrays[anga + '_times'] = self.times[anga]
+            arrays[anga + '_numbers'] = self.numbers[anga]
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        data = np.load(path)
+        times, numbers = {}, {}
+        for anga in angas:
+            times[anga] = data[anga + '_times']
+            numbers[anga] = data[anga + '_numbers']
+        return cls(times, numbers)
+
+    def at(self, anga, jd):
+        """Period of `anga` running at `jd`, None if outside the index"""
+        times = self.times[anga]
+        i = np.searchsorted(times, jd, side='right') - 1
+        if 0 <= i < len(times) - 1:
+            return Period(int(self.numbers[anga][i]), float(times[i]),
+                          float(times[i + 1]))
+
+    def between(self, anga, start, end):
+        """Generates the periods of `anga` overlapping `start` to `end`"""
+        times = self.times[anga]
+        numbers = self.numbers[anga]
+        i = max(np.searchsorted(times, start, side='right') - 1, 0)
+        while i < len(times) - 1 and times[i] < end:
+            yield Period(int(numbers[i]), float(times[i]), float(times[i + 1]))
+            i += 1
+
+# ----- TESTS ------
+
+
+def index_tests():
+    import os
+    import tempfile
+    import time
+    from panchanga import Date, Place, gregorian_to_jd, sunrise, tithi, \
+        nakshatra, yoga, karana, from_dms
+    print(sys._getframe().f_code.co_name)
+    bangalore = Place(12.972, 77.594, +5.5)
+    start = gregorian_to_jd(Date(2013, 1, 1))
+    t = time.time()
+    index = TransitionIndex.build(start, start + 366 * 5)
+    print("5 years indexed in %.2f s" % (time.time() - t))
+    path = os.path.join(tempfile.mkdtemp(), 'transitions.npz')
+    index.save(path)
+    index = TransitionIndex.load(path)
+
+    for jd in np.arange(start, start + 365, 7.0):
+        rise = sunrise(jd, bangalore)[0] - bangalore.timezone / 24.
+        for anga, func in [('tithi', tithi), ('nakshatra', nakshatra),
+                           ('yoga', yoga)]:
+            expected = func(jd, bangalore)
+            period = index.at(anga, rise)
+            assert(period.number == expected[0])
+            ends = (period.end - jd) * 24 + bangalore.timezone
+            assert(abs(ends - from_dms(*expected[1])) < 30 / 3600.)
+        assert(index.at('karana', rise).number == karana(jd, bangalore)[0])
+
+    periods = list(index.between('tithi', start, start + 30))
+    assert(all(a.end == b.start for a, b in zip(periods, periods[1:])))
+    assert(len(periods) in (30, 31, 32))
+
+
+if __name__ == "__main__":
+    import sys
+    index_tests()
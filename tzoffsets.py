@@ -0,0 +1,141 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# tzoffsets.py -- UTC offsets of a time zone for many dates at once
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Place.timezone is the UTC offset (hours) on the given date, which changes
+with daylight saving time. Rather than asking pytz once per date, the
+transitions of each zone are read once into arrays, and offsets of any
+number of dates are found with one searchsorted.
+
+    table = offset_table('Europe/Helsinki')
+    table.offsets(jds)      # hours, for dates as from gregorian_to_jd()
+    calendar(start, end, place, offsets=table.offsets(jds))
+
+Dates follow the GUI: the offset in effect at local midnight, taking
+daylight saving time where midnight is skipped or repeated.
+"""
+
+from __future__ import division
+import numpy as np
+import swisseph as swe
+from pytz import timezone
+from panchanga import Place
+
+_tables = {}
+
+
+class OffsetTable(object):
+    """UTC offsets (hours) of a time zone and the local times (JD) from
+       which each applies, in float64 arrays"""
+
+    def __init__(self, starts, offsets):
+        self.starts = starts
+        self.offsets_after = offsets
+
+    @classmethod
+    def from_zone(cls, zone):
+        """Table of a pytz time zone (or its name)"""
+        if not hasattr(zone, 'utcoffset'):
+            zone = timezone(zone)
+        transitions = getattr(zone, '_utc_transition_times', None)
+        if not transitions:  # UTC and other fixed offsets
+            return cls(np.array([-np.inf]),
+                       np.array([zone.utcoffset(None).total_seconds() / 3600]))
+
+        offsets = [info[0].total_seconds() / 3600
+                   for info in zone._transition_info]
+        # A transition applies from the local time it happens at, by the
+        # clock before it: skipped times get the new (summer) offset and
+        # repeated times the old one, as utcoffset(is_dst=True) does
+        starts = [-np.inf]
+        for t, before in zip(transitions[1:], offsets):
+            ut = swe.julday(t.year, t.month, t.day,
+                            t.hour + t.minute / 60 + t.second / 3600)
+            starts.append(ut + before / 24)
+        return cls(np.array(starts), np.array(offsets))
+
+    def offsets(self, jds):
+        """UTC offsets (hours) at each of the local times `jds`"""
+        i = np.searchsorted(self.starts, jds, side='right') - 1
+        return self.offsets_after[i]
+
+    def offset(self, jd): return float(self.offsets(jd))
+
+
+def offset_table(zone):
+    """OffsetTable of the time zone (name or pytz zone), built once"""
+    name = getattr(zone, 'zone', zone)
+    if name not in _tables:
+        _tables[name] = OffsetTable.from_zone(zone)
+    return _tables[name]
+
+
+def places(jds, latitude, longitude, zone):
+    """Place of each of the dates `jds` at given location"""
+    return [Place(latitude, longitude, tz)
+            for tz in offset_table(zone).offsets(jds).tolist()]
+
+
+def places_on(jd, latitudes, longitudes, zones):
+    """Place of each location on date `jd`; one lookup per distinct zone"""
+    zones = np.asarray(zones)
+    tz = np.empty(len(zones), dtype=np.float64)
+    for zone in np.unique(zones).tolist():
+        tz[zones == zone] = offset_table(zone).offset(jd)
+    return [Place(lat, lon, offset) for lat, lon, offset in
+            zip(np.asarray(latitudes).tolist(), np.asarray(longitudes).tolist(),
+                tz.tolist())]
+
+# ----- TESTS ------
+
+
+def offset_tests():
+    import time
+    from datetime import datetime, timedelta
+    print(sys._getframe().f_code.co_name)
+    first = datetime(1900, 1, 1)
+    dates = [first + timedelta(days=i) for i in range(0, 365 * 150, 1)]
+    jds = np.array([swe.julday(d.year, d.month, d.day, 0.0) for d in dates])
+    for name in ['Europe/Helsinki', 'America/New_York', 'America/Sao_Paulo',
+                 'Asia/Kolkata', 'Australia/Lord_Howe', 'UTC', 'Etc/GMT-5']:
+        zone = timezone(name)
+        start = time.time()
+        expected = [zone.localize(d, is_dst=True).utcoffset().total_seconds()
+                    / 3600 for d in dates]
+        pytz_time = time.time() - start
+        start = time.time()
+        offsets = offset_table(name).offsets(jds)
+        table_time = time.time() - start
+        assert(offsets.tolist() == expected)
+        print("%s: %d dates, pytz %.3f s, table %.5f s" %
+              (name, len(dates), pytz_time, table_time))
+
+    year = swe.julday(2013, 1, 1, 0.0) + np.arange(365)
+    helsinki = places(year, 60.17, 24.94, 'Europe/Helsinki')
+    assert([p.timezone for p in helsinki].count(3) == 210)
+    on = places_on(year[0], [60.17, 12.97], [24.94, 77.59],
+                   ['Europe/Helsinki', 'Asia/Kolkata'])
+    assert([p.timezone for p in on] == [2, 5.5])
+
+
+if __name__ == "__main__":
+    import sys
+    offset_tests()
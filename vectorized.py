@@ -0,0 +1,293 @@
+#!/usr/bin/env python
+# -*- coding: UTF-8 -*-
+
+# vectorized.py -- NumPy versions of the routines in panchanga.py
+#
+# This file is part of the "drik-panchanga" Python library
+# for computing Hindu luni-solar calendar based on the Swiss ephemeris
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+Batch (array-at-a-time) computation of longitudes and the quantities
+derived from them. Needs NumPy in addition to the Swiss ephemeris.
+"""
+
+from __future__ import division
+import numpy as np
+import swisseph as swe
+import panchanga
+import vimsottari
+from panchanga import planet_list
+from chart import shodasavarga, varga_tables, trimsamsa_odd, trimsamsa_even
+from collections import namedtuple as struct
+
+one_star = 360 / 27   # = 13°20'
+one_pada = 360 / 108  # = 3°20'
+
+
+def sidereal_longitudes(jds, planets=planet_list):
+    """Nirayana longitudes of `planets` at each of the Julian days `jds` (UT).
+       Returns a float64 array of shape (len(jds), len(planets)).
+
+       Ketu is derived from Rahu (MEAN_NODE), which is fetched only once.
+    """
+    jds = np.ascontiguousarray(jds, dtype=np.float64).ravel()
+    ayanamsa = panchanga.get_ayanamsa_mode()
+    flags = panchanga._tropical_flags if ayanamsa.tropical \
+        else panchanga._sidereal_flags
+
+    # Planets actually fetched from the ephemeris; Ketu comes from Rahu
+    fetch = []
+    for planet in planets:
+        planet = swe.MEAN_NODE if planet == swe.KETU else planet
+        if planet not in fetch:
+            fetch.append(planet)
+
+    # All planets of one instant together: the Swiss ephemeris reuses the
+    # Earth's position and nutation of the previous call at the same jd
+    calc_ut = swe.calc_ut
+    rows = [[calc_ut(jd, planet, flag=flags)[0][0] for planet in fetch]
+            for jd in jds.tolist()]
+    fetched = np.array(rows, dtype=np.float64).reshape(len(jds), len(fetch))
+    if ayanamsa.tropical:
+        get_ayanamsa_ut = swe.get_ayanamsa_ut
+        fetched -= np.array([get_ayanamsa_ut(jd) for jd in jds.tolist()],
+                            dtype=np.float64)[:, np.newaxis]
+    fetched %= 360
+
+    result = np.empty((len(jds), len(planets)), dtype=np.float64)
+    for i, planet in enumerate(planets):
+        if planet == swe.KETU:
+            result[:, i] = ketu(fetched[:, fetch.index(swe.MEAN_NODE)])
+        else:
+            result[:, i] = fetched[:, fetch.index(planet)]
+
+    return result
+
+
+def solar_longitudes(jds): return sidereal_longitudes(jds, [swe.SUN])[:, 0]
+
+
+def lunar_longitudes(jds): return sidereal_longitudes(jds, [swe.MOON])[:, 0]
+
+
+def lunar_phase(jds):
+    """Moon's longitude minus the Sun's, in [0, 360), at each of `jds`"""
+    sun, moon = sidereal_longitudes(jds, [swe.SUN, swe.MOON]).T
+    return (moon - sun) % 360
+
+
+def nakshatra_pada(longitudes):
+    """Nakshatra (1..27) and paada (1..4) in which each longitude lies.
+       Returns two int arrays."""
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    quotient = np.floor(longitudes / one_star)
+    reminder = longitudes - quotient * one_star
+    pada = np.floor(reminder / one_pada)
+    # convert 0..26 to 1..27 and 0..3 to 1..4
+    return 1 + quotient.astype(np.int64), 1 + pada.astype(np.int64)
+
+
+def rasi_index(longitudes):
+    """Sign in which each longitude lies. 0 = Mesha, ..., 11 = Meena"""
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    return np.floor(longitudes / 30).astype(np.int64)
+
+
+def navamsa_from_long(longitudes):
+    """Navamsa sign in which each longitude falls. 0 = Aries, ..., 11 = Pisces"""
+    longitudes = np.asarray(longitudes, dtype=np.float64)
+    fraction_left = (longitudes / 40) % 1  # 9 navamsas of 3°20' span 30°
+    return np.floor(fraction_left * 12).astype(np.int64)
+
+
+# Flattened: the sign of part p of sign s is at s * n + p
+_varga_tables = dict((n, np.array(table, dtype=np.int8).ravel())
+                     for n, table in varga_tables.items())
+_trimsamsa = [(np.array([end for end, sign in parts[:-1]], dtype=np.float64),
+               np.array([sign for end, sign in parts], dtype=np.int8))
+              for parts in (trimsamsa_odd, trimsamsa_even)]
+
+
+def vargas(longitudes, divisions=shodasavarga):
+    """Signs (0 = Mesha, ..., 11 = Meena) of the longitudes in each of the
+       divisional charts `divisions` (default: all of the Shodasavarga),
+       as {n: int8 array of the same shape as longitudes}. An (N, 11) array
+       of sidereal_longitudes() gives the charts of N instants at once."""
+    longitudes = np.asarray(longitudes, dtype=np.float64) % 360
+    sign = (longitudes // 30).astype(np.intp)
+    degrees = longitudes - sign * 30
+    result = {}
+    for n in divisions:
+        if n == 30:
+            (odd_ends, odd_signs), (even_ends, even_signs) = _trimsamsa
+            result[n] = np.where(
+                sign % 2 == 0,
+                odd_signs[np.searchsorted(odd_ends, degrees, side='right')],
+                even_signs[np.searchsorted(even_ends, degrees, side='right')])
+        else:
+            part = np.minimum((degrees * (n / 30)).astype(np.intp), n - 1)
+            part += sign * n
+            result[n] = _varga_tables[n].take(part)
+    return result
+
+
+# Ketu is always 180° after Rahu
+def ketu(rahu): return (np.asarray(rahu, dtype=np.float64) + 180) % 360
+
+
+# Vimsottari dasha lords and their years, twice over so that the sequence
+# from any lord is contiguous; _dasa_points are the cumulative fractions of
+# 120 years at which each begins
+_dasa_lords = np.array(vimsottari.adhipati_list * 2)
+_dasa_years = np.array([vimsottari.mahadasa[lord]
+                        for lord in vimsottari.adhipati_list] * 2, np.float64)
+_dasa_points = np.concatenate([[0], np.cumsum(_dasa_years) / 120])
+
+DashaPeriods = struct('DashaPeriods', ['lords', 'starts', 'ends'])
+
+
+def vimsottari_dashas(birth_jds, jds, depth=3, moon=None):
+    """Vimsottari periods running at `jds` for births at `birth_jds` (both
+       JD UT1, broadcast against each other). `moon` is the sidereal moon at
+       birth, computed here if not given.
+
+       Returns one DashaPeriods per level, from dasa down to `depth` (3 =
+       antara): arrays of lords (as in vimsottari.adhipati_list, -1 outside
+       the 120 years), start and end JDs (NaN outside).
+    """
+    birth_jds, jds = np.broadcast_arrays(np.asarray(birth_jds, np.float64),
+                                         np.asarray(jds, np.float64))
+    if moon is None:
+        moon = lunar_longitudes(birth_jds.ravel()).reshape(birth_jds.shape)
+    nak, rem = np.divmod(np.asarray(moon, np.float64), one_star)
+    lord = nak.astype(np.int64) % 9
+
+    # The dasa running at birth began this much earlier (dasha_start_date)
+    length = _dasa_years[lord] * vimsottari.vimsottari_year
+    start = birth_jds - rem / one_star * length
+    # The whole 120 years is one period of the same lord, whose sub-periods
+    # are the dasas; each level below splits its parent alike
+    length = 120 * vimsottari.vimsottari_year
+    outside = ~((start <= jds) & (jds < start + length))
+
+    result = []
+    for level in range(depth):
+        offset = _dasa_points[lord]
+        elapsed = offset + (jds - start) / length
+        i = np.searchsorted(_dasa_points, elapsed, side='right') - 1
+        i = np.clip(i, lord, lord + 8)
+        start = start + (_dasa_points[i] - offset) * length
+        length = length * _dasa_years[i] / 120
+        lord = i % 9
+        result.append(DashaPeriods(np.where(outside, -1, _dasa_lords[lord]),
+                                   np.where(outside, np.nan, start),
+                                   np.where(outside, np.nan, start + length)))
+    return result
+
+# ----- TESTS ------
+
+
+def scalar_tests():
+    print(sys._getframe().f_code.co_name)
+    jd = swe.julday(2015, 9, 25, 13 + 29/60. + 13/3600.)
+    jds = jd + np.arange(0, 30, 0.37)
+    longs = sidereal_longitudes(jds)
+    assert(longs.shape == (len(jds), len(planet_list)))
+    assert(longs.flags['C_CONTIGUOUS'] and longs.dtype == np.float64)
+    for i, t in enumerate(jds):
+        nv = panchanga.navamsa(t, panchanga.Place(0, 0, 0))
+        assert(nv == [[p, n] for p, n in zip(planet_list,
+                                               navamsa_from_long(longs[i]))])
+        nak, pada = nakshatra_pada(longs[i])
+        assert([[n, p] for n, p in zip(nak, pada)] ==
+               [panchanga.nakshatra_pada(x) for x in longs[i]])
+        assert(abs(lunar_phase([t])[0] - panchanga.lunar_phase(t)) < 1e-9)
+
+
+def speed_tests(n=100000):
+    print(sys._getframe().f_code.co_name)
+    jds = 2451545.0 + np.linspace(0, 365.25 * 30, n)
+    start = time.time()
+    phase = lunar_phase(jds)
+    elapsed = time.time() - start
+    print("lunar_phase: %d points in %.2f s (%.0f/s)" % (n, elapsed, n / elapsed))
+
+    start = time.time()
+    nakshatra_pada(phase), navamsa_from_long(phase), rasi_index(phase), ketu(phase)
+    elapsed = time.time() - start
+    print("derived helpers: %d points in %.4f s" % (n, elapsed))
+
+
+def varga_tests(n=300000):
+    from chart import Chart, varga_sign
+    print(sys._getframe().f_code.co_name)
+    jd = swe.julday(2015, 9, 25, 13 + 29/60. + 13/3600.)
+    longs = sidereal_longitudes(jd + np.arange(0, 3000, 7.3))
+    signs = vargas(longs)
+    assert(sorted(signs) == shodasavarga)
+    for d in shodasavarga:
+        assert(signs[d].shape == longs.shape)
+        assert(signs[d].tolist() ==
+               [[varga_sign(x, d) for x in row] for row in longs.tolist()])
+    assert((signs[9] == navamsa_from_long(longs)).all())
+    chart = Chart(jd, panchanga.Place(0, 0, 0))
+    assert(vargas([chart.longitudes], [9])[9][0].tolist() ==
+           [sign for planet, sign in chart.navamsa()])
+
+    longs = np.random.RandomState(1).uniform(0, 360, (n, len(planet_list)))
+    start = time.time()
+    vargas(longs)
+    elapsed = time.time() - start
+    print("16 vargas of %d charts (x %d grahas): %.2f s (%.0f charts/s)" %
+          (n, len(planet_list), elapsed, n / elapsed))
+
+
+def dasha_tests(n=1000000):
+    print(sys._getframe().f_code.co_name)
+    births = 2446225.67360654 + np.linspace(-20000, 20000, 400)
+    tonight = 2456950.5
+    dasa, bhukti, antara = vimsottari_dashas(births, tonight)
+    for k, birth in enumerate(births):
+        tree = vimsottari.DashaTree.from_birth(birth)
+        expected = tree.at(tonight, 3)
+        if not expected:
+            assert(dasa.lords[k] == -1 and np.isnan(antara.starts[k]))
+        for period, level in zip(expected, [dasa, bhukti, antara]):
+            assert(period.lords[-1] == level.lords[k])
+            assert(abs(period.start - level.starts[k]) < 1e-6)
+            assert(abs(period.end - level.ends[k]) < 1e-6)
+
+    random = np.random.RandomState(1)
+    births = 2440000 + random.uniform(0, 20000, n)
+    start = time.time()
+    lunar_longitudes(births[:n // 10])
+    elapsed = time.time() - start
+    print("moon at birth: %.0f charts/s" % (n // 10 / elapsed))
+    moon = random.uniform(0, 360, n)
+    start = time.time()
+    vimsottari_dashas(births, tonight, moon=moon)
+    elapsed = time.time() - start
+    print("dasa/bhukti/antara: %d charts in %.2f s (%.0f charts/s)" %
+          (n, elapsed, n / elapsed))
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+    scalar_tests()
+    speed_tests()
+    varga_tests()
+    dasha_tests()
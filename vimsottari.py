@@ -29,8 +29,11 @@ Calculates Vimshottari (=120) Dasha-bhukti-antara-sukshma-prana
 from __future__ import division
 from datetime import datetime
 from math import ceil
+from array import array
+from bisect import bisect_left, bisect_right
 import swisseph as swe
 from collections import OrderedDict as Dict
+from collections import namedtuple as struct
 from panchanga import sidereal_longitude, sidereal_year, get_planet_name, gregorian_to_jd, jd_to_gregorian
 
 swe.KETU = swe.PLUTO  # I've mapped Pluto to Ketu
@@ -51,11 +54,12 @@ mahadasa = {swe.KETU: 7, swe._SUKRA: 20, swe._SURYA: 6, swe._CHANDRA: 10, swe._K
 def adhipati(nak): return adhipati_list[nak % (len(adhipati_list))]
 
 
+_next_adhipati = dict(zip(adhipati_list, adhipati_list[1:] + adhipati_list[:1]))
+
+
 def next_adhipati(lord):
     """Returns next guy after `lord` in the adhipati_list"""
-    current = adhipati_list.index(lord)
-    next_index = (current + 1) % len(adhipati_list)
-    return adhipati_list[next_index]
+    return _next_adhipati[lord]
 
 
 def nakshatra_position(jdut1):
@@ -81,30 +85,41 @@ def dasha_start_date(jdut1):
     return [lord, start_date]
 
 
+class Periods(Dict):
+    """Start dates of consecutive periods by lord, in time order. The lords
+       and start dates are also kept as lists, for where_occurs() to bisect;
+       the dict is not meant to be changed afterwards"""
+
+    def __init__(self, items=()):
+        Dict.__init__(self, items)
+        self.lords = list(self.keys())
+        self.starts = list(self.values())
+
+
 def vimsottari_mahadasa(jdut1):
     """List all mahadashas and their start dates"""
     lord, start_date = dasha_start_date(jdut1)
-    retval = Dict()
+    retval = []
     for i in range(9):
-        retval[lord] = start_date
+        retval.append((lord, start_date))
         start_date += mahadasa[lord] * vimsottari_year
         lord = next_adhipati(lord)
 
-    return retval
+    return Periods(retval)
 
 
 def vimsottari_bhukti(maha_lord, start_date):
     """Compute all bhuktis of given nakshatra-lord of Mahadasa
     and its start date"""
     lord = maha_lord
-    retval = Dict()
+    retval = []
     for i in range(9):
-        retval[lord] = start_date
+        retval.append((lord, start_date))
         factor = mahadasa[lord] * mahadasa[maha_lord] / 120.
         start_date += factor * vimsottari_year
         lord = next_adhipati(lord)
 
-    return retval
+    return Periods(retval)
 
 # North Indian tradition: dasa-antardasa-pratyantardasa
 # South Indian tradition: dasa-bhukti-antara-sukshma
@@ -114,24 +129,26 @@ def vimsottari_antara(maha_lord, bhukti_lord, start_date):
     """Compute all antaradasas from given bhukit's start date.
     The bhukti's lord and its lord (mahadasa lord) must be given"""
     lord = bhukti_lord
-    retval = Dict()
+    retval = []
     for i in range(9):
-        retval[lord] = start_date
+        retval.append((lord, start_date))
         factor = mahadasa[lord] * (mahadasa[maha_lord] / 120.)
         factor *= (mahadasa[bhukti_lord] / 120.)
         start_date += factor * vimsottari_year
         lord = next_adhipati(lord)
 
-    return retval
+    return Periods(retval)
 
 
 def where_occurs(jd, some_dict):
     """Returns minimum key such that some_dict[key] < jd"""
     # It is assumed that the dict is sorted in ascending order
     # i.e. some_dict[i] < some_dict[j]  where i < j
-    for key in reversed(some_dict.keys()):
-        if some_dict[key] < jd:
-            return key
+    if not isinstance(some_dict, Periods):
+        some_dict = Periods(some_dict)
+    i = bisect_left(some_dict.starts, jd)
+    if i > 0:
+        return some_dict.lords[i - 1]
 
 
 def compute_antara_from(jd, mahadashas):
@@ -147,6 +164,140 @@ def compute_antara_from(jd, mahadashas):
     antara = vimsottari_antara(i, j, bhuktis[j])
     return (i, j, antara)
 
+
+def _sub_period_fractions(i):
+    """A period of lord adhipati_list[i] divides into 9 sub-periods, the first
+       of the same lord and then in order of adhipati_list. Returns the points
+       (0 to 1) of the period at which they begin, and the period's end"""
+    points = [0]
+    for lord in adhipati_list[i:] + adhipati_list[:i]:
+        points.append(points[-1] + mahadasa[lord] / 120.)
+    points[-1] = 1.0
+    return points
+
+
+_fractions = [_sub_period_fractions(i) for i in range(len(adhipati_list))]
+
+levels = ['dasa', 'bhukti', 'antara', 'sukshma', 'prana']
+
+# `lords` has one lord per level, from dasa down to this period's own
+Dasha = struct('Dasha', ['lords', 'start', 'end'])
+
+
+def _children(lord, start, end):
+    """Lord indices (into adhipati_list) of the 9 sub-periods of period from
+       `start` to `end` of lord index `lord`, and their 10 boundaries"""
+    length = end - start
+    boundaries = [start + length * f for f in _fractions[lord]]
+    boundaries[-1] = end
+    return [(lord + i) % 9 for i in range(9)], boundaries
+
+
+class DashaTree(object):
+    """All five levels (dasa to prana) of the 120 years of vimsottari dasha
+       from the mahadasa of `lord` beginning at `start` (JD UT1).
+
+       Nothing below the dasas is computed until asked for. at() descends
+       one period per level, searching only its 9 sub-periods. level()
+       builds the start times of all periods of a level as one flat array,
+       for searching ranges; walk() generates them without storing any."""
+
+    def __init__(self, lord, start):
+        self.start = start
+        self.end = start + 120 * vimsottari_year
+        index = adhipati_list.index(lord)
+        lords, starts = _children(index, self.start, self.end)
+        # Per level: lord indices (array of bytes) and start times (array of
+        # doubles, one more than lords: the end of the last period)
+        self._lords = [array('b', lords)]
+        self._starts = [array('d', starts)]
+
+    @classmethod
+    def from_birth(cls, jdut1):
+        lord, start = dasha_start_date(jdut1)
+        return cls(lord, start)
+
+    def level(self, depth):
+        """Flat arrays of lord indices and start times (plus the final end)
+           of all 9**depth periods at level `depth` (1 = dasa, 5 = prana)"""
+        while len(self._lords) < depth:
+            parent_lords, parent_starts = self._lords[-1], self._starts[-1]
+            lords, starts = array('b'), array('d')
+            for i, lord in enumerate(parent_lords):
+                sub_lords, boundaries = _children(lord, parent_starts[i],
+                                                  parent_starts[i + 1])
+                lords.extend(sub_lords)
+                starts.extend(boundaries[:-1])
+            starts.append(self.end)
+            self._lords.append(lords)
+            self._starts.append(starts)
+        return self._lords[depth - 1], self._starts[depth - 1]
+
+    def at(self, jd, depth=5):
+        """Periods containing `jd`, one per level from dasa to `depth`.
+           Empty if `jd` is outside the 120 years"""
+        if not self.start <= jd < self.end:
+            return []
+        result = []
+        lords, boundaries = self._lords[0], self._starts[0]
+        path = ()
+        for level in range(depth):
+            i = bisect_right(boundaries, jd, 0, 9) - 1
+            start, end = boundaries[i], boundaries[i + 1]
+            path += (adhipati_list[lords[i]],)
+            result.append(Dasha(path, start, end))
+            lords, boundaries = _children(lords[i], start, end)
+        return result
+
+    def between(self, start, end, depth=5):
+        """Generates the periods at level `depth` overlapping `start` to `end`"""
+        lords, starts = self.level(depth)
+        i = max(bisect_right(starts, start, 0, len(lords)) - 1, 0)
+        while i < len(lords) and (starts[i] < end or starts[i] <= start):
+            yield self._period(depth, i)
+            i += 1
+
+    def _period(self, depth, i):
+        """i-th period at level `depth`; its parent is the (i // 9)-th"""
+        starts = self._starts[depth - 1]
+        path = []
+        index = i
+        for level in range(depth, 0, -1):
+            path.append(adhipati_list[self._lords[level - 1][index]])
+            index //= 9
+        return Dasha(tuple(reversed(path)), starts[i], starts[i + 1])
+
+    def walk(self, depth=5):
+        """Generates every period down to level `depth`, each followed by its
+           sub-periods (depth first, in time order). Only the periods above
+           the current one are held in memory"""
+        stack = [((), list(zip(self._lords[0], self._starts[0][:-1],
+                                self._starts[0][1:]))[::-1])]
+        while stack:
+            path, pending = stack[-1]
+            if not pending:
+                stack.pop()
+                continue
+            lord, start, end = pending.pop()
+            period = Dasha(path + (adhipati_list[lord],), start, end)
+            yield period
+            if len(period.lords) < depth:
+                lords, boundaries = _children(lord, start, end)
+                stack.append((period.lords,
+                              list(zip(lords, boundaries[:-1],
+                                       boundaries[1:]))[::-1]))
+
+    def export(self, fp, depth=5):
+        """Writes every period down to level `depth` to file `fp` as CSV
+           (level, lords, start and end JD UT1), one line at a time"""
+        names = dict((lord, get_planet_name(lord)) for lord in adhipati_list)
+        fp.write('level,lords,start,end\n')
+        for period in self.walk(depth):
+            fp.write('%s,%s,%.6f,%.6f\n' %
+                     (levels[len(period.lords) - 1],
+                      '/'.join(names[lord] for lord in period.lords),
+                      period.start, period.end))
+
 # ---------------------- ALL TESTS ------------------------------
 
 
@@ -161,8 +312,60 @@ def adhipati_tests():
     assert(mahadasa[adhipati(aslesha)] == 17)
 
 
+def dasha_tree_tests():
+    import io
+    import time
+    import tracemalloc
+    print(sys._getframe().f_code.co_name)
+    jdut1 = swe.utc_to_jd(1985, 6, 9, 4, 10, 0, flag=swe.GREG_CAL)[1]
+    tree = DashaTree.from_birth(jdut1)
+    dashas = vimsottari_mahadasa(jdut1)
+    jd = 2456950
+    i, j, antara = compute_antara_from(jd, dashas)
+    dasa, bhukti, antara_period, sukshma, prana = tree.at(jd)
+    assert(dasa.lords == (i,) and abs(dasa.start - dashas[i]) < 1e-6)
+    assert(bhukti.lords == (i, j))
+    k = where_occurs(jd, antara)
+    assert(antara.starts == list(antara.values()))
+    assert(where_occurs(jd, Dict(antara)) == k)
+    assert(antara_period.lords == (i, j, k))
+    assert(abs(antara_period.start - antara[k]) < 1e-6)
+    assert(antara_period.start <= sukshma.start <= prana.start <= jd < prana.end
+           <= sukshma.end <= antara_period.end)
+    assert(list(tree.between(jd, jd, 5)) == [prana])
+    assert(tree.at(tree.end) == [] and tree.at(tree.start)[4].start == tree.start)
+
+    lords, starts = tree.level(5)
+    assert(len(lords) == 9 ** 5 and len(starts) == 9 ** 5 + 1)
+    assert(all(a < b for a, b in zip(starts, starts[1:])))
+    for jd in starts[::997]:
+        assert(tree.at(jd)[-1] == list(tree.between(jd, jd))[0])
+
+    out = io.StringIO()
+    start = time.time()
+    DashaTree.from_birth(jdut1).export(out)
+    elapsed = time.time() - start
+    assert(out.getvalue().count('\n') == 1 + sum(9 ** d for d in range(1, 6)))
+    tracemalloc.start()
+    for period in DashaTree.from_birth(jdut1).walk():
+        pass
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print("export of all 5 levels: %.2f s, walk() peak memory %d KB" %
+          (elapsed, peak // 1024))
+
+    start = time.time()
+    for jd in range(int(tree.start), int(tree.end), 10):
+        tree.at(jd)
+    print("at(): %.1f us per lookup" %
+          ((time.time() - start) * 1e6 / len(range(int(tree.start),
+                                                   int(tree.end), 10))))
+
+
 if __name__ == "__main__":
+    import sys
     adhipati_tests()
+    dasha_tree_tests()
     # YYYY-MM-DD 09:40 IST = 04:10 UTC
     jdut1 = swe.utc_to_jd(1985, 6, 9, 4, 10, 0, flag=swe.GREG_CAL)[1]
     tz = 5.5